@@ -1,6 +1,8 @@
 from __future__ import annotations  # future >= 3.10
 
-from typing import Optional, Tuple, TYPE_CHECKING
+from typing import List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
 
 import color
 import exceptions
@@ -9,9 +11,17 @@ import exceptions
 if TYPE_CHECKING:
     from engine import Engine
     from entity import Actor, Entity, Item
+    from game_map import GameMap
+
+
+# how far away the sounds of a fight can wake dormant actors
+MELEE_NOISE_RADIUS = 6
 
 
 class Action:
+    # game time this action takes an actor of normal speed
+    cost = 100
+
     def __init__(self, entity: Actor) -> None:
         super().__init__()
         self.entity = entity
@@ -81,17 +91,14 @@ class PickupAction(Action):
         super().__init__(entity)
 
     def perform(self) -> None:
-        actor_location_x = self.entity.x
-        actor_location_y = self.entity.y
         inventory = self.entity.inventory
 
-        for item in self.engine.game_map.items:
-            if actor_location_x == item.x and actor_location_y == item.y:
-                inventory.insert(item)
+        for item in self.engine.game_map.items.at(self.entity.x, self.entity.y):
+            inventory.insert(item)
 
-                # insert will raise if full
-                self.engine.game_map.entities.remove(item)
-                return
+            # insert will raise if full
+            self.engine.game_map.remove_entity(item)
+            return
 
         raise exceptions.Impossible("There is nothing to pick up")
 
@@ -140,6 +147,8 @@ class MeleeAction(ActionWithDirection):
 
         damage = self.entity.fighter.power - target.fighter.defense
 
+        self.engine.game_map.make_noise(target.x, target.y, MELEE_NOISE_RADIUS)
+
         action_desc = f"{self.entity.name.capitalize()} attacks {target.name}"
         if self.entity is self.engine.player:
             attack_color = color.PLAYER_ATK
@@ -161,6 +170,8 @@ class MovementAction(ActionWithDirection):
     def perform(self) -> None:
         dest_x, dest_y = self.dest_xy
 
+        if max(abs(self.dx), abs(self.dy)) > 1:
+            raise exceptions.Impossible("You can't move that far")
         if not self.engine.game_map.in_bounds(dest_x, dest_y):
             raise exceptions.Impossible(
                 "Your path is blocked"
@@ -177,6 +188,65 @@ class MovementAction(ActionWithDirection):
         self.entity.move(self.dx, self.dy)
 
 
+def perform_moves(
+    game_map: GameMap, moves: Sequence[MovementAction]
+) -> List[MovementAction]:
+    """
+    Perform many moves at once as if they happened together, returning those that happened
+
+    A move happens if its destination is next to the mover, can be walked on
+    and nobody is standing there, which includes actors that moved out of the way;
+    when moves compete for a tile the first of them wins,
+    so the outcome only depends on the order of `moves`
+    Moves that can't happen are dropped, as a MovementAction would raise Impossible
+    """
+    if not moves:
+        return []
+
+    origin_x = np.array([move.entity.x for move in moves])
+    origin_y = np.array([move.entity.y for move in moves])
+    step_x = np.array([move.dx for move in moves])
+    step_y = np.array([move.dy for move in moves])
+    dest_x = origin_x + step_x
+    dest_y = origin_y + step_y
+
+    valid = (
+        (np.maximum(abs(step_x), abs(step_y)) <= 1)
+        & (0 <= dest_x)
+        & (dest_x < game_map.width)
+        & (0 <= dest_y)
+        & (dest_y < game_map.height)
+    )
+    valid[valid] = game_map.tiles["walkable"][dest_x[valid], dest_y[valid]]
+
+    # positions as flat indices, so that sets of them are plain integer arrays
+    origins = origin_x * game_map.height + origin_y
+    destinations = dest_x * game_map.height + dest_y
+    xs, ys = game_map.actors.positions()
+    occupied = xs * game_map.height + ys
+
+    # each round moves the first mover into every free destination,
+    # which frees their old tiles for the next round
+    pending = np.flatnonzero(valid)
+    moved = np.zeros(len(moves), dtype=bool)
+    while pending.size:
+        free = pending[~np.isin(destinations[pending], occupied)]
+        if not free.size:
+            break
+        _, first = np.unique(destinations[free], return_index=True)
+        winners = free[first]
+        moved[winners] = True
+        occupied = np.concatenate(
+            (occupied[~np.isin(occupied, origins[winners])], destinations[winners])
+        )
+        pending = pending[~moved[pending]]
+
+    performed = [moves[i] for i in np.flatnonzero(moved)]
+    for move in performed:
+        move.entity.move(move.dx, move.dy)
+    return performed
+
+
 class BumpAction(ActionWithDirection):
     def perform(self) -> None:
         if self.target_actor:
@@ -0,0 +1,60 @@
+import glob
+import os
+from typing import Callable, Optional
+
+import numpy as np  # type: ignore
+import tcod
+
+import constants
+
+
+TILESHEET_FILE = "dejavu10x10_gs_tc.png"
+BACKGROUND_FILE = "menu_background.png"
+
+_background_image: Optional[np.ndarray] = None
+
+
+def cached_array(source: str, decode: Callable[[str], np.ndarray]) -> np.ndarray:
+    """
+    Return the decoded contents of `source`, using a cache file keyed by its mtime
+
+    The first load decodes the source and writes the result as a raw .npy file,
+    which later runs read back without decoding until the source changes
+    """
+    name = os.path.basename(source)
+    mtime = os.stat(source).st_mtime_ns
+    cache_file = os.path.join(constants.ASSET_CACHE_DIR, f"{name}.{mtime}.npy")
+
+    try:
+        return np.load(cache_file)
+    except (OSError, ValueError):
+        pass  # missing or unreadable; decode again
+
+    array = decode(source)
+
+    try:
+        os.makedirs(constants.ASSET_CACHE_DIR, exist_ok=True)
+        for stale in glob.glob(os.path.join(constants.ASSET_CACHE_DIR, f"{name}.*")):
+            os.remove(stale)
+        np.save(cache_file, array)
+    except OSError:
+        pass  # the cache is only an optimization
+
+    return array
+
+
+def load_tileset() -> tcod.tileset.Tileset:
+    # libtcod decodes the sheet faster than a Tileset can be rebuilt tile by tile
+    # from a cached array, so this isn't cached
+    return tcod.tileset.load_tilesheet(TILESHEET_FILE, 32, 8, tcod.tileset.CHARMAP_TCOD)
+
+
+def load_background_image() -> np.ndarray:
+    """Return the main menu background, decoded on first use"""
+    global _background_image
+    if _background_image is None:
+        # remove the alpha channel
+        _background_image = cached_array(
+            BACKGROUND_FILE, lambda path: tcod.image.load(path)[:, :, :3]
+        )
+    return _background_image
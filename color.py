@@ -24,3 +24,4 @@ BAR_EMPTY = (0x40, 0x10, 0x10)
 
 MENU_TITLE = (0xFF, 0xFF, 0x3F)
 MENU_TEXT = WHITE
+MENU_DISABLED = (0x80, 0x80, 0x80)
@@ -4,9 +4,6 @@ import random
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
 
-import numpy as np  # type: ignore
-import tcod
-
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
 
 if TYPE_CHECKING:
@@ -16,35 +13,24 @@ if TYPE_CHECKING:
 class BaseAI(Action):
     entity: Actor
 
-    def perform(self) -> None:
+    def get_action(self) -> Action:
+        """Decide what this actor does with its turn"""
         raise NotImplementedError()
 
+    def perform(self) -> None:
+        self.get_action().perform()
+
+    def hear_noise(self, x: int, y: int) -> None:
+        """React to a noise at the given location; by default noises are ignored"""
+        pass
+
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
         """
         Compute and return a path to the target position
 
         If there is no valid path returns an empty list
         """
-        # copy the walkable array
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # check if the entity blocks movement and the cost isn't zero (ie tile is walkable)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # add to the tile's cost
-                # lower values mean enemies will crowd in behind each other
-                # higher values mean enemies will take longer paths to avoid crowding
-                cost[entity.x, entity.y] += 10  # TODO: extract to constant?
-
-        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
-        pathfinder = tcod.path.Pathfinder(graph)
-
-        pathfinder.add_root((self.entity.x, self.entity.y))  # start position
-
-        # compute the path and remove the starting point
-        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
-
-        return [(i[0], i[1]) for i in path]
+        return self.entity.gamemap.path_to(self.entity.x, self.entity.y, dest_x, dest_y)
 
 
 class HostileEnemy(BaseAI):
@@ -52,25 +38,47 @@ class HostileEnemy(BaseAI):
         super().__init__(entity)
         self.path: List[Tuple[int, int]] = []
 
-    def perform(self) -> None:
+    def get_action(self) -> Action:
         target = self.engine.player
         dx = target.x - self.entity.x
         dy = target.y - self.entity.y
         distance = max(abs(dx), abs(dy))  # Chebyshev distance
+        sees_target = self.entity.gamemap.sight.can_see(self.entity, target.x, target.y)
 
-        if self.engine.game_map.visible[self.entity.x, self.entity.y]:
+        if sees_target:
             if distance <= 1:
-                return MeleeAction(self.entity, dx, dy).perform()
+                return MeleeAction(self.entity, dx, dy)
 
             self.path = self.get_path_to(target.x, target.y)
 
+        # steps only come off the path once they're taken, so a move that didn't happen
+        # is tried again, unless the actor has since been moved off its path
+        if self.path and self.path[0] == (self.entity.x, self.entity.y):
+            self.path.pop(0)
+        if self.path:
+            dest_x, dest_y = self.path[0]
+            if max(abs(dest_x - self.entity.x), abs(dest_y - self.entity.y)) > 1:
+                self.path = []
+            elif self.entity.gamemap.get_blocking_entity_at_location(dest_x, dest_y):
+                # find a way around whoever is in the way
+                self.path = self.get_path_to(*self.path[-1])
+
         if self.path:
-            dest_x, dest_y = self.path.pop(0)
+            dest_x, dest_y = self.path[0]
             return MovementAction(
                 self.entity, dest_x - self.entity.x, dest_y - self.entity.y
-            ).perform()
+            )
+
+        if not sees_target:
+            # nothing to chase and nowhere to go; drop off the schedule until woken
+            self.engine.game_map.sleep_actor(self.entity)
 
-        return WaitAction(self.entity).perform()
+        return WaitAction(self.entity)
+
+    def hear_noise(self, x: int, y: int) -> None:
+        """Head towards the noise unless already chasing something"""
+        if not self.path:
+            self.path = self.get_path_to(x, y)
 
 
 class ConfusedEnemy(BaseAI):
@@ -87,12 +95,13 @@ class ConfusedEnemy(BaseAI):
         self.previous_ai = previous_ai
         self.turns_remaining = turns_remaining
 
-    def perform(self) -> None:
+    def get_action(self) -> Action:
         if self.turns_remaining <= 0:
             self.engine.message_log.add_message(
                 f"The {self.entity.name} is no longer confused"
             )
             self.entity.ai = self.previous_ai
+            return WaitAction(self.entity)
         else:
             direction_x, direction_y = random.choice(
                 [(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (1, 0), (0, -1), (0, 1)]
@@ -102,4 +111,4 @@ class ConfusedEnemy(BaseAI):
 
             # try to move or attack in the chosen random direction
             # if the actor bumps into a wall it will waste its turn
-            return BumpAction(self.entity, direction_x, direction_y).perform()
+            return BumpAction(self.entity, direction_x, direction_y)
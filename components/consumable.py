@@ -18,6 +18,13 @@ if TYPE_CHECKING:
     from entity import Actor, Item
 
 
+# how far away the blast of a fireball can wake dormant actors, as a multiple of its radius
+FIREBALL_NOISE_FACTOR = 3
+
+# how far away the thunder of a lightning bolt can wake dormant actors
+LIGHTNING_NOISE_RADIUS = 10
+
+
 class Consumable(BaseComponent):
     parent: Item
 
@@ -75,6 +82,8 @@ class ConfusionConsumable(Consumable):
         target.ai = components.ai.ConfusedEnemy(
             entity=target, previous_ai=target.ai, turns_remaining=self.number_of_turns
         )
+        # a dormant actor takes no turns, so it would stay confused until something woke it
+        self.engine.game_map.wake_actor(target)
         self.consume()
 
 
@@ -117,10 +126,7 @@ class FireballDamageConsumable(Consumable):
         if not self.engine.game_map.visible[target_xy]:
             raise Impossible("You cannot target an area that you cannot see")
 
-        targets = []
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                targets.append(actor)
+        targets = self.engine.game_map.actors_in_radius(*target_xy, self.radius)
         if not targets:
             raise Impossible("There are no targets in the blast radius")
 
@@ -133,6 +139,9 @@ class FireballDamageConsumable(Consumable):
             )
             target.fighter.take_damage(self.damage)
 
+        self.engine.game_map.make_noise(
+            *target_xy, radius=self.radius * FIREBALL_NOISE_FACTOR
+        )
         self.consume()
 
 
@@ -143,16 +152,13 @@ class LightningDamageConsumable(Consumable):
 
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
-        target = None
-        closest_distance = self.maximum_range + 10
-
-        for actor in self.engine.game_map.actors:
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        target = self.engine.game_map.nearest_actor(
+            consumer.x,
+            consumer.y,
+            visible_only=True,
+            max_range=self.maximum_range,
+            exclude=consumer,
+        )
 
         if target:
             self.engine.message_log.add_message(
@@ -162,6 +168,9 @@ class LightningDamageConsumable(Consumable):
                 f"A lightning bolt strikes the {target.name} with a loud thunder for {self.damage} damage",
             )
             target.fighter.take_damage(self.damage)
+            self.engine.game_map.make_noise(
+                target.x, target.y, radius=LIGHTNING_NOISE_RADIUS
+            )
             self.consume()
         else:
             raise Impossible("There are no enemies close enough to strike")
@@ -83,6 +83,7 @@ class Fighter(BaseComponent):
         self.parent.ai = None
         self.parent.name = f"{self.parent.name} remains"
         self.parent.render_order = RenderOrder.CORPSE
+        self.gamemap.mark_dead(self.parent)
 
         self.engine.message_log.add_message(death_message, death_message_color)
 
@@ -1,8 +1,7 @@
 from __future__ import annotations
 
-import collections
-from collections import defaultdict
-from typing import Dict, List, Optional, TYPE_CHECKING
+import heapq
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 import exceptions
 from components.base_component import BaseComponent
@@ -12,40 +11,82 @@ if TYPE_CHECKING:
 
 
 class Inventory(BaseComponent):
+    """
+    Items held by an actor, in lettered slots
+
+    Each slot holds a stack; stackable items with the same name share a stack
+    and every other item gets a slot of its own
+    A stack keeps its slot, and so its letter, until it is emptied
+    """
+
     parent: Actor
 
     def __init__(self, capacity: int):
         self._capacity = capacity
-        # items stack in lists
+        # items stack in insertion-ordered dicts used as sets
         # so as to maintain unique properties of items that may be orthogonal to stacking
-        self._items: collections.defaultdict[str, List[Item]] = defaultdict(list)
+        # while letting any single item be removed in O(1)
+        self._slots: List[Optional[Dict[Item, None]]] = [None] * capacity
+        # free slot indices as a heap, so new stacks take the earliest free letter
+        self._free_slots: List[int] = list(range(capacity))
+        # where the stack for each stackable item name lives
+        self._stack_slots: Dict[str, int] = {}
+        # the slot holding each item
+        self._item_slots: Dict[Item, int] = {}
 
     @property
     def capacity(self) -> int:
         return self._capacity
 
-    @property
-    def contents(self) -> Dict[str, List[Item]]:
-        return {name: items for name, items in self._items.items() if len(items) > 0}
+    def __len__(self) -> int:
+        """The number of occupied slots"""
+        return self._capacity - len(self._free_slots)
 
-    def item_stack(self, item_name: str) -> Optional[List[Item]]:
-        if item_name in self._items:
-            return self._items[item_name]
-        return None
+    def __contains__(self, item: Item) -> bool:
+        return item in self._item_slots
+
+    @property
+    def items(self) -> Iterator[Item]:
+        """Every item in the inventory, stack by stack"""
+        for stack in self._slots:
+            if stack:
+                yield from stack
+
+    def slots(self) -> Iterator[Tuple[int, Item, int]]:
+        """Yield (slot index, first item, stack size) for each occupied slot in order"""
+        for index, stack in enumerate(self._slots):
+            if stack:
+                yield index, next(iter(stack)), len(stack)
+
+    def item_in_slot(self, index: int) -> Optional[Item]:
+        """Return the first item of the stack in the given slot, or None if it's empty"""
+        if not 0 <= index < self._capacity:
+            return None
+        stack = self._slots[index]
+        if not stack:
+            return None
+        return next(iter(stack))
 
     def insert(self, item: Item, add_message: bool = True) -> None:
         """
         Insert an item into the inventory, respecting stacks, and raise if the inventory is full
         """
-        if (
-            not (item.name in self._items and item.stackable)
-            and len(self._items) >= self.capacity
-        ):
+        if item.stackable and item.name in self._stack_slots:
+            index = self._stack_slots[item.name]
+        elif self._free_slots:
+            index = heapq.heappop(self._free_slots)
+            self._slots[index] = {}
+            if item.stackable:
+                self._stack_slots[item.name] = index
+        else:
             raise exceptions.Impossible("Your inventory is full")
 
         item.parent = self
 
-        self._items[item.name].append(item)
+        stack = self._slots[index]
+        assert stack is not None
+        stack[item] = None
+        self._item_slots[item] = index
         # unfortunately, we can't remove the item from its current location
         # as we don't know how nested our parent is from the GameMap or other Inventory
         # that currently owns the item
@@ -58,7 +99,17 @@ class Inventory(BaseComponent):
         """
         Removes the item from the inventory. Does NOT handle reowning the item
         """
-        self._items[item.name].remove(item)
+        index = self._item_slots.pop(item)
+        stack = self._slots[index]
+        assert stack is not None
+        del stack[item]
+
+        if not stack:
+            # free the slot so an empty stack doesn't count against the capacity
+            self._slots[index] = None
+            heapq.heappush(self._free_slots, index)
+            if self._stack_slots.get(item.name) == index:
+                del self._stack_slots[item.name]
 
     def drop(self, item: Item) -> None:
         """
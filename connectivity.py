@@ -0,0 +1,91 @@
+from typing import Tuple
+
+import numpy as np  # type: ignore
+
+
+# offsets to the neighbours in the next row, which with the runs along each row
+# cover all 8 directions
+_ROW_OFFSETS = [(-1, 1), (0, 1), (1, 1)]
+
+
+def label_regions(walkable: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Label the 8-connected regions of a boolean map
+
+    Returns an int array the shape of `walkable` where 0 means not walkable
+    and each region is numbered from 1, along with the number of regions
+
+    Each unbroken run of walkable tiles along a row starts out as one node,
+    then a union-find joins the runs on whole arrays: every round, each root hooks onto
+    the lowest-numbered root it touches and pointers are jumped until every run
+    points straight at its region's root
+    It takes a handful of rounds, each costing a pass over the touching runs
+    """
+    width, height = walkable.shape
+    # column-major, so a tile's flat index is x + y * width and rows are contiguous
+    flat = np.asarray(walkable, dtype=bool).ravel(order="F")
+    size = flat.size
+    first_in_row = np.arange(size, dtype=np.int32) % width == 0
+
+    # number the runs from 0 in the order they start
+    run_starts = flat.copy()
+    run_starts[1:] &= ~flat[:-1] | first_in_row[1:]
+    run_of = np.cumsum(run_starts, dtype=np.int32) - 1
+    run_count = int(run_of[-1]) + 1 if size else 0
+
+    # pairs of runs that touch across rows
+    sources = []
+    targets = []
+    for dx, dy in _ROW_OFFSETS:
+        step = dx + dy * width
+        if dx and width == 1 or not 0 < step < size:
+            continue
+        touching = flat[:-step] & flat[step:]
+        # don't wrap around from one side of the map to the other
+        if dx == 1:
+            touching &= ~first_in_row[step:]
+        elif dx == -1:
+            touching &= ~first_in_row[:-step]
+        # runs touching along several tiles only need the first of them
+        touching[1:] &= ~touching[:-1] | first_in_row[1:-step]
+        start = np.flatnonzero(touching)
+        sources.append(run_of[start])
+        targets.append(run_of[start + step])
+    u = np.concatenate(sources) if sources else np.zeros(0, dtype=np.int32)
+    v = np.concatenate(targets) if targets else np.zeros(0, dtype=np.int32)
+
+    parent = np.arange(run_count, dtype=np.int32)
+    while len(u):
+        root_u = parent[u]
+        root_v = parent[v]
+        # roots only ever merge, so pairs already in one region can be dropped
+        differ = root_u != root_v
+        u = u[differ]
+        v = v[differ]
+        low = np.minimum(root_u[differ], root_v[differ])
+        high = np.maximum(root_u[differ], root_v[differ])
+        # hook each root onto the lowest root it touches
+        np.minimum.at(parent, high, low)
+        # jump pointers until each run points at a root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    # number the regions from 1, leaving unwalkable tiles as 0
+    is_root = parent == np.arange(run_count)
+    region_of_run = np.cumsum(is_root, dtype=np.int32)[parent]
+    labels = np.zeros(size, dtype=np.int32)
+    labels[flat] = region_of_run[run_of[flat]]
+    return labels.reshape((width, height), order="F"), int(is_root.sum())
+
+
+def largest_region(walkable: np.ndarray) -> np.ndarray:
+    """Return a boolean map of the largest 8-connected region of `walkable`"""
+    labels, count = label_regions(walkable)
+    if count == 0:
+        return np.zeros_like(walkable, dtype=bool)
+    sizes = np.bincount(labels.ravel(), minlength=count + 1)
+    sizes[0] = 0
+    return labels == np.argmax(sizes)
@@ -1,2 +1,5 @@
 TITLE = "KOBOLD-LIKE"
 SAVE_FILE = "savegame.sav"
+HISTORY_FILE = "savegame.log"
+ASSET_CACHE_DIR = ".cache"
+FLOOR_POOL_FILE = "floors.pool.npz"
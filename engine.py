@@ -1,44 +1,162 @@
 from __future__ import annotations
 
+import io
 import lzma
 import pickle
-from typing import TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 
 from tcod.console import Console
 from tcod.map import compute_fov
 
+from actions import MovementAction, perform_moves
 import exceptions
+from game_map import SHARED_PATH_MINIMUM
 from message_log import MessageLog
 import render_functions
+from turn_scheduler import time_to_act
 
 if TYPE_CHECKING:
+    from actions import Action
     from entity import Actor
     from game_map import GameMap
     from game_world import GameWorld
+    from journal import Journal
 
 
 PLAYER_FOV_RADIUS = 8
 
 
+class _ForkPickler(pickle.Pickler):
+    """Pickles a game, leaving out the objects given by id for its forks to share"""
+
+    def __init__(self, file: io.BytesIO, shared: Dict[int, int]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = shared
+
+    def persistent_id(self, obj: object) -> Optional[int]:
+        return self.shared.get(id(obj))
+
+
 class Engine:
     game_map: GameMap
     game_world: GameWorld
-
-    def __init__(self, player: Actor, viewport_width: int, viewport_height: int):
-        self.message_log = MessageLog()
+    # records turns so they can be rewound; off unless something starts one
+    journal: Optional[Journal] = None
+    journal_ignores = ("journal",)
+
+    def __init__(
+        self,
+        player: Actor,
+        viewport_width: int,
+        viewport_height: int,
+        history_path: Optional[str] = None,
+    ):
+        self.message_log = MessageLog(history_path)
         self.mouse_location = (0, 0)  # in viewport-space
         self.player = player
         self.viewport_width = viewport_width
         self.viewport_height = viewport_height
         self.debug_mode = False
 
-    def handle_enemy_turns(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai:
+    def __getstate__(self) -> dict:
+        # the journal is for the game as it's being played, so saves and forks leave it out
+        state = self.__dict__.copy()
+        state.pop("journal", None)
+        return state
+
+    def fork(self) -> Engine:
+        """
+        Return a copy of the game to play ahead in without changing this one
+
+        The copy shares this game's tiles, read only, and its floor pool,
+        and starts an empty message log with no history file
+        """
+        tiles = self.game_map.tiles.view()
+        tiles.flags.writeable = False
+        shared = [
+            (self.game_map.tiles, tiles),
+            (self.message_log, MessageLog(buffer_size=self.message_log.buffer_size)),
+            (self.game_world.floor_pool, self.game_world.floor_pool),
+        ]
+
+        # pickling is quicker than copy.deepcopy, and copies just what a save would
+        buffer = io.BytesIO()
+        _ForkPickler(
+            buffer,
+            {
+                id(original): i
+                for i, (original, _) in enumerate(shared)
+                if original is not None
+            },
+        ).dump(self)
+        buffer.seek(0)
+        unpickler = pickle.Unpickler(buffer)
+        unpickler.persistent_load = lambda i: shared[i][1]  # type: ignore
+        fork: Engine = unpickler.load()
+        return fork
+
+    def handle_enemy_turns(self, time_spent: int) -> None:
+        """
+        Let the awake actors act during the `time_spent` units of game time after a player action
+
+        Faster actors get more turns in the same time; dormant actors wait to be woken
+        Nothing here needs a console, so simulations can fast-forward by passing a large time
+        """
+        scheduler = self.game_map.scheduler
+        until = scheduler.time + time_spent
+
+        while self.player.is_alive:
+            actors = scheduler.pop_due_together(until)
+            if not actors:
+                break
+            self.take_turns(actors)
+
+    def take_turns(self, actors: List[Actor]) -> None:
+        """
+        Let actors due at the same moment act together
+
+        Every actor decides on its action first, seeing the map as it was before any of them
+        acted, so a crowd chasing the player can share one pathfinder; then the other actions
+        are performed in turn and all the moves are resolved at once by `perform_moves`
+        """
+        scheduler = self.game_map.scheduler
+        # work out together what the actors can see of the player before they decide
+        sight = self.game_map.sight
+        player_x, player_y = self.player.x, self.player.y
+        sight.look(actors, player_x, player_y)
+        hunters = sum(sight.can_see(actor, player_x, player_y) for actor in actors)
+        if hunters >= SHARED_PATH_MINIMUM:
+            self.game_map.share_paths_to(player_x, player_y)
+
+        intents: List[Tuple[Actor, Action]] = []
+        try:
+            for actor in actors:
+                if not actor.ai:
+                    scheduler.unschedule(actor)
+                    continue
+                intents.append((actor, actor.ai.get_action()))
+        finally:
+            self.game_map.stop_sharing_paths()
+
+        moves: List[MovementAction] = []
+        for actor, action in intents:
+            if isinstance(action, MovementAction):
+                moves.append(action)
+            elif self.player.is_alive and actor in scheduler:
                 try:
-                    entity.ai.perform()
+                    action.perform()
                 except exceptions.Impossible:
                     pass  # ignore impossible actions
+        if self.player.is_alive:
+            # actors killed by the actions before them don't get to move
+            perform_moves(
+                self.game_map, [move for move in moves if move.entity in scheduler]
+            )
+
+        for actor, action in intents:
+            # the actor may have been put to sleep or killed during its turn
+            if actor in scheduler:
+                scheduler.schedule(actor, time_to_act(action.cost, actor.speed))
 
     def update_fov(self) -> None:
         """Recompute the visible area based on the player POV"""
@@ -48,6 +166,13 @@ class Engine:
             radius=PLAYER_FOV_RADIUS,
         )
         self.game_map.explored |= self.game_map.visible
+        self.game_map.visible_changed(
+            self.player.x - PLAYER_FOV_RADIUS,
+            self.player.y - PLAYER_FOV_RADIUS,
+            self.player.x + PLAYER_FOV_RADIUS + 1,
+            self.player.y + PLAYER_FOV_RADIUS + 1,
+        )
+        self.game_map.wake_visible_actors()
 
     def render(self, console: Console) -> None:
         self.game_map.render(console, self.viewport_width, self.viewport_height)
@@ -5,6 +5,8 @@ import math
 from typing import Optional, Tuple, Type, TypeVar, TYPE_CHECKING, Union
 
 from render_order import RenderOrder
+from sight import DEFAULT_SIGHT_RADIUS
+from turn_scheduler import NORMAL_SPEED
 
 if TYPE_CHECKING:
     from components.ai import BaseAI
@@ -46,7 +48,7 @@ class Entity:
         self.render_order = render_order
         if parent:
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
     @property
     def gamemap(self) -> GameMap:
@@ -58,7 +60,7 @@ class Entity:
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
 
     def place(self, x: int, y: int, gamemap: Optional[GameMap] = None) -> None:
@@ -68,9 +70,11 @@ class Entity:
         if gamemap:
             if hasattr(self, "parent"):
                 if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
+                    self.gamemap.remove_entity(self)
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
+        elif hasattr(self, "parent"):
+            self.gamemap.entity_moved(self)
 
     def distance(self, x: int, y: int) -> float:
         """Return the distance from this entity to the given point"""
@@ -79,6 +83,7 @@ class Entity:
     def move(self, dx: int, dy: int) -> None:
         self.x += dx
         self.y += dy
+        self.gamemap.entity_moved(self)
 
 
 class Actor(Entity):
@@ -94,7 +99,9 @@ class Actor(Entity):
         equipment: Equipment,
         fighter: Fighter,
         inventory: Inventory,
-        level: Level
+        level: Level,
+        speed: int = NORMAL_SPEED,
+        sight_radius: int = DEFAULT_SIGHT_RADIUS
     ):
         super().__init__(
             x=x,
@@ -120,6 +127,11 @@ class Actor(Entity):
         self.level = level
         self.level.parent = self
 
+        # how often this actor gets to act, relative to NORMAL_SPEED
+        self.speed = speed
+        # how far this actor can see, if nothing is in the way
+        self.sight_radius = sight_radius
+
     @property
     def is_alive(self) -> bool:
         """Returns True as long as this actor can perform actions"""
@@ -42,6 +42,7 @@ TROLL = Actor(
     fighter=Fighter(hp=16, base_defense=1, base_power=4),
     inventory=Inventory(capacity=0),
     level=Level(xp_given=100),
+    sight_radius=6,
 )
 
 DAGGER = Item(
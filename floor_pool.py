@@ -0,0 +1,253 @@
+"""
+Build a pool of floors ahead of time for the game to draw from instead of generating them
+
+Floors are generated exactly as GameWorld would generate them, then stored
+as tile ids, the player's start, the stairs, the rooms and a record of each spawn
+
+    $ python floor_pool.py --depths 1-10 --floors 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+import warnings
+
+import numpy as np  # type: ignore
+
+import constants
+from entity import Entity
+import entity_factories
+from game_map import GameMap
+import tile_types
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+# the tile types a floor can be made of; a tile's id is its place in this list
+TILE_NAMES = ("WALL", "FLOOR", "STAIRS_DOWN")
+
+# the entity prototypes spawns can be made from, by their names in entity_factories
+PROTOTYPES: Dict[str, Entity] = {
+    name: prototype
+    for name, prototype in vars(entity_factories).items()
+    if isinstance(prototype, Entity)
+}
+
+# spawned entities are copies, so they're matched back to their prototypes by name
+_prototype_names = {prototype.name: name for name, prototype in PROTOTYPES.items()}
+
+# held while a pool reads its file, as games sharing a pool may be made on other threads
+_load_lock = threading.Lock()
+
+SPAWN_DT = np.dtype([("prototype", np.uint16), ("x", np.int16), ("y", np.int16)])
+ROOM_DT = np.dtype(
+    [("x", np.int16), ("y", np.int16), ("width", np.int16), ("height", np.int16)]
+)
+
+
+class FloorRecord(NamedTuple):
+    tiles: np.ndarray  # tile ids
+    player: Tuple[int, int]
+    stairs: Tuple[int, int]
+    spawns: np.ndarray  # SPAWN_DT, with prototypes indexing PROTOTYPES
+    rooms: np.ndarray  # ROOM_DT
+
+
+def record_floor(game_map: GameMap) -> FloorRecord:
+    """Return a record of a freshly generated floor, before anything on it has moved"""
+    tiles = np.zeros((game_map.width, game_map.height), dtype=np.uint8, order="F")
+    for tile_id, name in enumerate(TILE_NAMES):
+        tiles[game_map.tiles == getattr(tile_types, name)] = tile_id
+
+    prototype_ids = {name: index for index, name in enumerate(PROTOTYPES)}
+    player = game_map.engine.player
+    spawns = np.array(
+        [
+            (prototype_ids[_prototype_names[entity.name]], entity.x, entity.y)
+            for entity in game_map.entities
+            if entity is not player
+        ],
+        dtype=SPAWN_DT,
+    )
+    rooms = np.array(
+        [
+            (room.x1, room.y1, room.x2 - room.x1, room.y2 - room.y1)
+            for room in game_map.rooms
+        ],
+        dtype=ROOM_DT,
+    )
+
+    return FloorRecord(
+        tiles, (player.x, player.y), game_map.downstairs_location, spawns, rooms
+    )
+
+
+def write_pool(path: str, floors_by_depth: Dict[int, List[FloorRecord]]) -> None:
+    """Write floor records to a pool file, grouped by the depth they were made for"""
+    arrays: Dict[str, np.ndarray] = {
+        "tile_names": np.array(TILE_NAMES),
+        "prototypes": np.array(list(PROTOTYPES)),
+    }
+    for depth, floors in floors_by_depth.items():
+        arrays[f"tiles_{depth}"] = np.stack([floor.tiles for floor in floors])
+        arrays[f"players_{depth}"] = np.array([floor.player for floor in floors])
+        arrays[f"stairs_{depth}"] = np.array([floor.stairs for floor in floors])
+        # the spawns and rooms of every floor run together, split by offsets
+        for kind in ("spawns", "rooms"):
+            parts = [getattr(floor, kind) for floor in floors]
+            arrays[f"{kind}_{depth}"] = np.concatenate(parts)
+            arrays[f"{kind}_offsets_{depth}"] = np.cumsum(
+                [0] + [len(part) for part in parts]
+            )
+
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+
+class FloorPool:
+    """
+    Floors generated ahead of time and stored in a file by `write_pool`
+
+    The file is read the first time a floor is needed, and again after unpickling
+    A missing file is treated as an empty pool
+    """
+
+    # the floors read from the file are never changed by play
+    journal_ignores = ("_depths", "_tiles", "_prototypes")
+
+    def __init__(self, path: str):
+        self.path = path
+        # the arrays of each depth, by name; None until the file is read
+        self._depths: Optional[Dict[int, Dict[str, np.ndarray]]] = None
+        # the tile type and prototype for each id used in the file
+        self._tiles = np.array([], dtype=tile_types.tile_dt)
+        self._prototypes: List[Entity] = []
+
+    def __getstate__(self) -> dict:
+        # the floors are read back from the file rather than saved with the game
+        state = self.__dict__.copy()
+        state["_depths"] = None
+        state["_tiles"] = np.array([], dtype=tile_types.tile_dt)
+        state["_prototypes"] = []
+        return state
+
+    def _load(self) -> Dict[int, Dict[str, np.ndarray]]:
+        if self._depths is not None:
+            return self._depths
+        with _load_lock:
+            if self._depths is not None:
+                return self._depths  # read while waiting for the lock
+
+            # only published once it's whole, as readers don't take the lock
+            depths: Dict[int, Dict[str, np.ndarray]] = {}
+            try:
+                pool = np.load(self.path)
+            except OSError:
+                pool = None  # no pool; every floor will be generated
+
+            if pool is not None:
+                with pool:
+                    self._tiles = np.stack(
+                        [getattr(tile_types, name) for name in pool["tile_names"]]
+                    )
+                    self._prototypes = [PROTOTYPES[name] for name in pool["prototypes"]]
+                    for key in pool.files:
+                        kind, _, depth = key.rpartition("_")
+                        if depth.isdigit():
+                            depths.setdefault(int(depth), {})[kind] = pool[key]
+            self._depths = depths
+        return self._depths
+
+    def floor_count(self, depth: int) -> int:
+        """Return how many floors the pool holds for a depth"""
+        floors = self._load().get(depth)
+        return 0 if floors is None else len(floors["tiles"])
+
+    def instantiate(self, depth: int, engine: Engine) -> GameMap:
+        """Build a game map from a random floor of the given depth"""
+        # imported here as procgen imports the whole map generation machinery
+        from procgen import RectangularRoom
+
+        floors = self._load()[depth]
+        index = random.randrange(len(floors["tiles"]))
+
+        player = engine.player
+        tile_ids = floors["tiles"][index]
+        dungeon = GameMap(engine, *tile_ids.shape, entities=[player])
+        dungeon.tiles[...] = self._tiles[tile_ids]
+
+        player.place(*floors["players"][index].tolist(), dungeon)
+        dungeon.downstairs_location = tuple(floors["stairs"][index].tolist())
+
+        start, end = floors["spawns_offsets"][index : index + 2]
+        for prototype, x, y in floors["spawns"][start:end].tolist():
+            self._prototypes[prototype].spawn(dungeon, x, y)
+
+        start, end = floors["rooms_offsets"][index : index + 2]
+        dungeon.rooms = [
+            RectangularRoom(*room) for room in floors["rooms"][start:end].tolist()
+        ]
+
+        return dungeon
+
+
+def parse_depths(text: str) -> List[int]:
+    """Parse depths given as a list such as `1,2,5` or a range such as `1-10`"""
+    depths: List[int] = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        depths.extend(range(int(first), int(last or first) + 1))
+    return depths
+
+
+def main() -> None:
+    # the game still uses some of tcod's deprecated names
+    warnings.simplefilter("ignore", FutureWarning)
+
+    from engine import Engine
+    from game_world import GameWorld
+    import setup_game
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depths", type=parse_depths, default="1-10")
+    parser.add_argument("--floors", type=int, default=20, help="floors per depth")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=constants.FLOOR_POOL_FILE)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    engine = Engine(
+        player=copy.deepcopy(entity_factories.PLAYER),
+        viewport_width=setup_game.VIEWPORT_WIDTH,
+        viewport_height=setup_game.VIEWPORT_HEIGHT,
+    )
+    engine.game_world = GameWorld(
+        engine=engine,
+        map_width=setup_game.MAP_WIDTH,
+        map_height=setup_game.MAP_HEIGHT,
+        max_rooms=setup_game.MAX_ROOMS,
+        room_min_size=setup_game.ROOM_MIN_SIZE,
+        room_max_size=setup_game.ROOM_MAX_SIZE,
+    )
+
+    floors_by_depth: Dict[int, List[FloorRecord]] = {}
+    for depth in args.depths:
+        floors = floors_by_depth[depth] = []
+        for _ in range(args.floors):
+            engine.game_world.current_floor = depth - 1
+            engine.game_world.generate_floor()
+            floors.append(record_floor(engine.game_map))
+
+    write_pool(args.output, floors_by_depth)
+    print(
+        f"wrote {args.floors} floors for each of depths {args.depths} to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,62 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional, Tuple, TYPE_CHECKING
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
 
 import numpy as np  # type: ignore
 from tcod.console import Console
+import tcod.path
 
 from entity import Actor, Item
+from overview import Overview
+from sight import Sight
+from spatial_index import SpatialIndex
 import tile_types
+from turn_scheduler import TurnScheduler
 
 if TYPE_CHECKING:
     from engine import Engine
     from entity import Entity
+    from procgen import RectangularRoom
 
 # TODO: put this in setup_game and thread it through
 # how close the player can get to the edge of the screen before the viewport anchor moves
 VIEWPORT_MARGIN = (10, 10)
 
+# what a step costs actors finding their way around, before the cost of the tile stepped on
+CARDINAL_STEP_COST = 2
+DIAGONAL_STEP_COST = 3
+NEIGHBOUR_OFFSETS = [
+    (-1, -1),
+    (0, -1),
+    (1, -1),
+    (-1, 0),
+    (1, 0),
+    (-1, 1),
+    (0, 1),
+    (1, 1),
+]
+# how many actors must be heading for the same point before they share one search of the map
+SHARED_PATH_MINIMUM = 2
+
+
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    """Pack a boolean map array into a bit per tile"""
+    return np.packbits(mask.ravel(order="F"))
+
+
+def unpack_mask(packed: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Unpack a boolean map array packed by `pack_mask`"""
+    bits = np.unpackbits(packed, count=width * height).view(bool)
+    return bits.reshape((width, height), order="F")
+
 
 class GameMap:
+    # caches which check themselves before use or are refreshed after a rewind,
+    # so needn't be recorded, and the area the journal hasn't looked at yet
+    journal_ignores = ("_shared_paths", "_sight", "_overview", "_changed_area")
+    # arrays the journal only compares within the area returned by take_changed_area
+    journal_areas = ("tiles", "visible", "explored")
+
     def __init__(
         self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = ()
     ):
@@ -27,7 +66,23 @@ class GameMap:
         # adjust_viewport_anchor() will fix this up before first run
         self.viewport_anchor_x, self.viewport_anchor_y = 0, 0
         self.viewport_margin_x, self.viewport_margin_y = VIEWPORT_MARGIN
-        self.entities = set(entities)
+        self.entities: Set[Entity] = set()
+        # typed subsets of entities, kept up to date by add_entity, remove_entity and mark_dead
+        # and indexed by position for the spatial queries below
+        self.actors: SpatialIndex[Actor] = SpatialIndex()  # living actors only
+        self.corpses: SpatialIndex[Actor] = SpatialIndex()
+        self.items: SpatialIndex[Item] = SpatialIndex()
+        # actors which are off the turn schedule until sight or noise wakes them
+        self.dormant_actors: Set[Actor] = set()
+        # actors which take turns, ordered by when they next act
+        self.scheduler = TurnScheduler()
+        # dormant actors never move, so their positions are only gathered when the set changes
+        self._dormant_positions: Optional[
+            Tuple[List[Actor], np.ndarray, np.ndarray, np.ndarray]
+        ] = None
+        for entity in entities:
+            self.add_entity(entity)
+
         self.tiles = np.full((width, height), fill_value=tile_types.WALL, order="F")
 
         # tiles that are currently visible
@@ -36,32 +91,318 @@ class GameMap:
         self.explored = np.full((width, height), fill_value=False, order="F")
 
         self.downstairs_location = (0, 0)
+        # the rooms the map was carved from, if it was made of rooms
+        self.rooms: List[RectangularRoom] = []
+        # built the first time the overview is shown, then kept up to date by explored_changed
+        self._overview: Optional[Overview] = None
+        # the destination and pathfinder set up by share_paths_to, while actors are deciding
+        self._shared_paths: Optional[Tuple[tuple, tcod.path.Pathfinder]] = None
+        # what each actor can see, made the first time an actor looks
+        self._sight: Optional[Sight] = None
+        # the rectangle the visible tiles lie within, and the rectangle the arrays have
+        # changed within since take_changed_area was last called
+        self._visible_area: Optional[Tuple[int, int, int, int]] = None
+        self._changed_area: Optional[Tuple[int, int, int, int]] = None
+
+    def __getstate__(self) -> dict:
+        # the masks are saved a bit per tile rather than a byte
+        state = self.__dict__.copy()
+        state["visible"] = pack_mask(self.visible)
+        state["explored"] = pack_mask(self.explored)
+        state["_overview"] = None
+        state["_shared_paths"] = None
+        state["_sight"] = None
+        state["_changed_area"] = None
+        state["_dormant_positions"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._shared_paths = None
+        self._sight = None
+        self._dormant_positions = None
+        # saves from before the areas were kept don't say where the visible tiles are
+        self._visible_area = state.get("_visible_area")
+        self._changed_area = None
+        for name in ("visible", "explored"):
+            mask = state[name]
+            # saves from before packing hold the arrays as they were
+            if mask.dtype != bool:
+                setattr(self, name, unpack_mask(mask, self.width, self.height))
 
     @property
     def gamemap(self) -> GameMap:
         return self
 
     @property
-    def actors(self) -> Iterator[Actor]:
-        yield from (
-            entity
-            for entity in self.entities
-            if isinstance(entity, Actor) and entity.is_alive
+    def sight(self) -> Sight:
+        """What each actor on this map can see"""
+        if self._sight is None:
+            self._sight = Sight(self)
+        return self._sight
+
+    def overview(self, width: int, height: int) -> Overview:
+        """Return an overview of the map shrunk by a whole scale to fit the given size"""
+        scale = max(-(-self.width // width), -(-self.height // height), 1)
+        if self._overview is None or self._overview.scale != scale:
+            self._overview = Overview(self, scale)
+        return self._overview
+
+    def explored_changed(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Note that tiles may have been explored in the given rectangle"""
+        self.area_changed(x1, y1, x2, y2)
+        if self._overview is not None:
+            self._overview.refresh(x1, y1, x2, y2)
+
+    def visible_changed(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Note that the visible tiles were recomputed, and now lie within the given rectangle"""
+        # the tiles seen before stop being visible wherever they were
+        if self._visible_area is None:
+            self.area_changed(0, 0, self.width, self.height)
+        else:
+            self.area_changed(*self._visible_area)
+        self._visible_area = x1, y1, x2, y2
+        self.explored_changed(x1, y1, x2, y2)
+
+    def area_changed(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Note that the map's arrays may have changed within the given rectangle"""
+        if self._changed_area is not None:
+            old_x1, old_y1, old_x2, old_y2 = self._changed_area
+            x1, y1 = min(x1, old_x1), min(y1, old_y1)
+            x2, y2 = max(x2, old_x2), max(y2, old_y2)
+        self._changed_area = x1, y1, x2, y2
+
+    def take_changed_area(self) -> Optional[Tuple[slice, slice]]:
+        """
+        Return the area the map's arrays may have changed in since this was last called
+
+        Returns None if they haven't changed
+        """
+        area, self._changed_area = self._changed_area, None
+        if area is None:
+            return None
+        x1, y1, x2, y2 = area
+        return (
+            slice(max(x1, 0), min(x2, self.width)),
+            slice(max(y1, 0), min(y2, self.height)),
         )
 
     @property
-    def items(self) -> Iterator[Item]:
-        yield from (entity for entity in self.entities if isinstance(entity, Item))
+    def awake_actors(self) -> Iterator[Actor]:
+        """Actors currently on the turn schedule"""
+        yield from self.scheduler
+
+    def add_entity(self, entity: Entity) -> None:
+        """Add an entity to this map; actors other than the player start out dormant"""
+        self.entities.add(entity)
+        if isinstance(entity, Actor):
+            if entity.is_alive:
+                self.actors.add(entity)
+                if entity is not self.engine.player:
+                    self.dormant_actors.add(entity)
+                    self._dormant_positions = None
+            else:
+                self.corpses.add(entity)
+        elif isinstance(entity, Item):
+            self.items.add(entity)
+
+    def remove_entity(self, entity: Entity) -> None:
+        """Remove an entity from this map and from the turn schedule"""
+        self.entities.remove(entity)
+        if isinstance(entity, Actor):
+            self.actors.discard(entity)
+            self.corpses.discard(entity)
+            self.unschedule_actor(entity)
+        elif isinstance(entity, Item):
+            self.items.discard(entity)
+
+    def entity_moved(self, entity: Entity) -> None:
+        """Bring the position indexes up to date after an entity on this map moves"""
+        for index in (self.actors, self.corpses, self.items):
+            if entity in index:
+                index.update(entity)  # type: ignore
+        if entity in self.dormant_actors:
+            self._dormant_positions = None
+
+    def mark_dead(self, actor: Actor) -> None:
+        """Move a newly dead actor to the corpses and stop it taking turns"""
+        self.actors.discard(actor)
+        self.corpses.add(actor)
+        self.unschedule_actor(actor)
+
+    def unschedule_actor(self, actor: Actor) -> None:
+        """Stop an actor taking turns at all"""
+        self.scheduler.unschedule(actor)
+        if actor in self.dormant_actors:
+            self.dormant_actors.remove(actor)
+            self._dormant_positions = None
+
+    def wake_actor(self, actor: Actor) -> None:
+        """Put a dormant actor back on the turn schedule"""
+        if actor in self.dormant_actors:
+            self.dormant_actors.remove(actor)
+            self._dormant_positions = None
+            self.scheduler.schedule(actor)
+
+    def sleep_actor(self, actor: Actor) -> None:
+        """Take an awake actor off the turn schedule until it is woken again"""
+        if actor in self.scheduler:
+            self.scheduler.unschedule(actor)
+            self.dormant_actors.add(actor)
+            self._dormant_positions = None
+
+    def dormant_positions(self) -> Tuple[List[Actor], np.ndarray, np.ndarray]:
+        """Return the dormant actors along with arrays of their x and y coordinates"""
+        actors, xs, ys, _ = self._dormant_arrays()
+        return actors, xs, ys
+
+    def _dormant_arrays(
+        self,
+    ) -> Tuple[List[Actor], np.ndarray, np.ndarray, np.ndarray]:
+        """Return the dormant actors along with arrays of their coordinates and sight radii"""
+        if self._dormant_positions is None:
+            actors = list(self.dormant_actors)
+            xs, ys, radii = (
+                np.fromiter(
+                    (getattr(actor, name) for actor in actors),
+                    dtype=np.intp,
+                    count=len(actors),
+                )
+                for name in ("x", "y", "sight_radius")
+            )
+            self._dormant_positions = actors, xs, ys, radii
+        return self._dormant_positions
+
+    def wake_visible_actors(self) -> None:
+        """
+        Wake every dormant actor that can see the player
+
+        Each actor looks as far as its own sight radius, so one that sees further than
+        the player can notice the player first; an actor that the player sees
+        but that can't see back stays asleep, as it would go straight back to sleep
+        """
+        if not self.dormant_actors:
+            return
+
+        player = self.engine.player
+        actors, xs, ys, radii = self._dormant_arrays()
+        in_range = (xs - player.x) ** 2 + (ys - player.y) ** 2 <= radii**2
+        for index in np.flatnonzero(in_range):
+            actor = actors[index]
+            if self.sight.can_see(actor, player.x, player.y):
+                self.wake_actor(actor)
+
+    def make_noise(self, x: int, y: int, radius: int) -> None:
+        """
+        Wake every dormant actor within `radius` of the given point
+
+        Woken actors are told where the noise came from so they can investigate
+        """
+        if not self.dormant_actors:
+            return
+
+        actors, xs, ys = self.dormant_positions()
+        in_earshot = (xs - x) ** 2 + (ys - y) ** 2 <= radius ** 2
+        for index in np.flatnonzero(in_earshot):
+            actor = actors[index]
+            self.wake_actor(actor)
+            if actor.ai:
+                actor.ai.hear_noise(x, y)
+
+    def path_costs(self) -> np.ndarray:
+        """Return the cost of stepping on each tile, making actors costly to path through"""
+        # copy the walkable array
+        cost = np.array(self.tiles["walkable"], dtype=np.int8)
+
+        # living actors are the only entities which block movement
+        xs, ys = self.actors.positions()
+        # only add to the cost of tiles where it isn't zero (ie tile is walkable)
+        walkable = cost[xs, ys] != 0
+        # add to the tile's cost
+        # lower values mean enemies will crowd in behind each other
+        # higher values mean enemies will take longer paths to avoid crowding
+        cost[xs[walkable], ys[walkable]] += 10  # TODO: extract to constant?
+        return cost
+
+    def share_paths_to(self, x: int, y: int) -> None:
+        """
+        Have `path_to` find paths to the given point with one pathfinder rooted there
+
+        Worth it once many actors head for the same point before any of them moves;
+        the search only spreads as far as the furthest actor that asks for a path
+        Call `stop_sharing_paths` before anything moves
+        """
+        graph = tcod.path.SimpleGraph(
+            cost=self.path_costs(),
+            cardinal=CARDINAL_STEP_COST,
+            diagonal=DIAGONAL_STEP_COST,
+        )
+        pathfinder = tcod.path.Pathfinder(graph)
+        pathfinder.add_root((x, y))
+        self._shared_paths = (x, y), pathfinder
+
+    def stop_sharing_paths(self) -> None:
+        self._shared_paths = None
+
+    def path_to(
+        self, x: int, y: int, dest_x: int, dest_y: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Return the path from one point to another, not including the starting point
+
+        If there is no valid path returns an empty list
+        """
+        if self._shared_paths is not None and self._shared_paths[0] == (dest_x, dest_y):
+            return self._shared_path_from(x, y)
+
+        graph = tcod.path.SimpleGraph(
+            cost=self.path_costs(),
+            cardinal=CARDINAL_STEP_COST,
+            diagonal=DIAGONAL_STEP_COST,
+        )
+        pathfinder = tcod.path.Pathfinder(graph)
+
+        pathfinder.add_root((x, y))  # start position
+
+        # compute the path and remove the starting point
+        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
+
+        return [(i[0], i[1]) for i in path]
+
+    def _shared_path_from(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """Return the path from a point to the destination given to `share_paths_to`"""
+        assert self._shared_paths is not None
+        pathfinder = self._shared_paths[1]
+        # searches on from where the last actor's search stopped
+        pathfinder.resolve((x, y))
+        distance = pathfinder.distance
+
+        # the pathfinder charges for stepping onto the start when there's an actor on it,
+        # which would make leaving it orthogonally look cheaper than leaving diagonally,
+        # so the first step is picked as if the start were open floor
+        first: Optional[Tuple[int, int]] = None
+        best = int(distance[x, y])
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            step_x, step_y = x + dx, y + dy
+            if not self.in_bounds(step_x, step_y):
+                continue
+            cost = int(distance[step_x, step_y]) + (
+                DIAGONAL_STEP_COST if dx and dy else CARDINAL_STEP_COST
+            )
+            if cost < best:
+                first, best = (step_x, step_y), cost
+        if first is None:
+            return []
+
+        path: List[List[int]] = pathfinder.path_from(first).tolist()
+        return [(i[0], i[1]) for i in path]
 
     def get_blocking_entity_at_location(
         self, location_x: int, location_y: int
     ) -> Optional[Entity]:
-        for entity in self.entities:
-            if (
-                entity.blocks_movement
-                and entity.x == location_x
-                and entity.y == location_y
-            ):
+        # only living actors ever block movement
+        for entity in self.actors.at(location_x, location_y):
+            if entity.blocks_movement:
                 return entity
 
         return None
@@ -69,11 +410,42 @@ class GameMap:
     def get_actor_at_location(
         self, location_x: int, location_y: int
     ) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == location_x and actor.y == location_y:
-                return actor
+        actors = self.actors.at(location_x, location_y)
+        return actors[0] if actors else None
 
-        return None
+    def actors_in_radius(self, x: int, y: int, radius: float) -> List[Actor]:
+        """Return the living actors within `radius` of the given location"""
+        return self.actors.in_radius(x, y, radius)
+
+    def entities_in_rect(self, x: int, y: int, width: int, height: int) -> List[Entity]:
+        """Return every entity on the map inside the given rectangle"""
+        entities: List[Entity] = []
+        for index in (self.corpses, self.items, self.actors):
+            entities.extend(index.in_rect(x, y, width, height))  # type: ignore
+        return entities
+
+    def nearest_actor(
+        self,
+        x: int,
+        y: int,
+        visible_only: bool = False,
+        max_range: Optional[float] = None,
+        exclude: Optional[Actor] = None,
+    ) -> Optional[Actor]:
+        """
+        Return the living actor closest to the given location, or None if there isn't one
+
+        `visible_only` ignores actors the player can't see
+        `max_range` limits how far away the actor can be
+        `exclude` leaves out one actor, usually the one asking
+        """
+        return self.actors.nearest(
+            x,
+            y,
+            max_range=max_range,
+            visible=self.visible if visible_only else None,
+            exclude=exclude,
+        )
 
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x and y are inside the bounds of this map"""
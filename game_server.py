@@ -0,0 +1,298 @@
+"""
+Host many games at once in one process, each played by its own client
+
+Clients send one key per line, such as `G`, `UP` or `SHIFT+PERIOD`, and get back
+one frame per key in the format spectator.py uses, starting with a keyframe
+Every session shares the tile types, entity prototypes and floor pool,
+so each costs only its own map, entities and messages
+New games are made on worker threads while the sessions play on the event loop,
+so making a game may only read what the sessions share: prototypes are copied
+when they spawn, the spawn tables are compiled when procgen is imported,
+and the floor pool reads its file under a lock
+
+    $ python game_server.py serve localhost:7778
+    $ python game_server.py bots localhost:7778 --clients 50 --turns 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import deque
+import itertools
+import pickle
+import random
+import resource
+import statistics
+import time
+import traceback
+from typing import Deque, Dict, List, Optional, Tuple
+import warnings
+
+import numpy as np  # type: ignore
+import tcod
+
+import color
+import constants
+from engine import Engine
+from floor_pool import FloorPool
+import input_handlers
+from main import SCREEN_HEIGHT, SCREEN_WIDTH
+import setup_game
+from spectator import MESSAGE_HEADER, FrameEncoder, apply_frame, parse_address
+
+# how many of the latest turns each session keeps the latency of
+LATENCY_SAMPLES = 1000
+
+# the keys scripted clients press: moving, waiting and picking things up
+BOT_KEYS = ("UP", "DOWN", "LEFT", "RIGHT", "Y", "U", "B", "N", "PERIOD", "G")
+
+
+def parse_key(line: str) -> tcod.event.KeyDown:
+    """Parse a key such as `G` or `SHIFT+PERIOD` into a key press"""
+    *modifiers, name = line.strip().upper().split("+")
+    try:
+        sym = tcod.event.KeySym[name]
+        mod = tcod.event.Modifier.NONE
+        for modifier in modifiers:
+            mod |= tcod.event.Modifier[modifier]
+    except KeyError as error:
+        raise ValueError(f"unknown key {line.strip()!r}") from error
+    return tcod.event.KeyDown(scancode=0, sym=sym, mod=mod)
+
+
+def percentiles(values: List[float]) -> Tuple[float, float, float]:
+    """Return the median, 99th percentile and maximum of some values"""
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[98], max(values)
+
+
+def new_session_game(floor_pool: FloorPool) -> Engine:
+    # the history would be written to a file every session shares
+    return setup_game.new_game(history_path=None, floor_pool=floor_pool)
+
+
+class Session:
+    """A game being played by one client"""
+
+    def __init__(self, number: int, engine: Engine):
+        self.number = number
+        self.engine = engine
+        self.handler: input_handlers.BaseEventHandler = (
+            input_handlers.MainGameEventHandler(self.engine)
+        )
+        self.console = tcod.console.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        self.encoder = FrameEncoder()
+        self.turns = 0
+        self.turn_seconds: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def render(self) -> bytes:
+        """Render the game and return what changed as a frame"""
+        self.console.clear()
+        self.handler.on_render(console=self.console)
+        frame = self.encoder.encode(self.console, always=True)
+        assert frame is not None
+        return frame
+
+    def handle_key(self, key: tcod.event.KeyDown) -> bytes:
+        """
+        Play a key press and return the frame it leads to
+
+        Raises SystemExit when the player quits
+        """
+        start = time.perf_counter()
+        try:
+            self.handler = self.handler.handle_events(key)
+            if isinstance(self.handler, input_handlers.GameOverEventHandler):
+                # the save and history files belong to whoever plays locally
+                self.handler.save_path = None
+        except SystemExit:
+            raise
+        except Exception:
+            traceback.print_exc()
+            if isinstance(self.handler, input_handlers.EventHandler):
+                self.handler.engine.message_log.add_message(
+                    traceback.format_exc(), color.ERROR
+                )
+        frame = self.render()
+        self.turn_seconds.append(time.perf_counter() - start)
+        self.turns += 1
+        return frame
+
+    def state_size(self) -> int:
+        """
+        Return roughly how many bytes of state belong to this session alone
+
+        This pickles the whole game, which holds up every other session while it runs
+        """
+        return len(pickle.dumps(self.engine))
+
+    def summary(self, state_size: bool = False) -> str:
+        p50, p99, worst = percentiles(list(self.turn_seconds))
+        summary = (
+            f"session {self.number:>4} {self.turns:>7} turns"
+            f" {p50 * 1000:8.2f} {p99 * 1000:8.2f} {worst * 1000:8.2f} ms"
+        )
+        if state_size:
+            summary += f" {self.state_size() / 1024:8.0f} KiB"
+        return summary
+
+
+class GameServer:
+    """Runs a session for each client connected to it"""
+
+    def __init__(self, floor_pool: FloorPool, report_state: bool = False):
+        self.floor_pool = floor_pool
+        # whether reports measure the state of every session, which stalls them all
+        self.report_state = report_state
+        self.sessions: Dict[int, Session] = {}
+        self._numbers = itertools.count(1)
+
+    async def on_connect(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        number = next(self._numbers)
+        # making a game takes long enough to hold up the other sessions' turns,
+        # so it's done on another thread; see the module docstring for what that allows
+        engine = await asyncio.get_running_loop().run_in_executor(
+            None, new_session_game, self.floor_pool
+        )
+        session = Session(number, engine)
+        self.sessions[session.number] = session
+        try:
+            writer.write(session.render())
+            while line := await reader.readline():
+                try:
+                    frame = session.handle_key(parse_key(line.decode()))
+                except ValueError:
+                    frame = session.render()  # still answer, so clients stay in step
+                writer.write(frame)
+                await writer.drain()
+        except (SystemExit, ConnectionError):
+            pass
+        finally:
+            del self.sessions[session.number]
+            print(f"ended {session.summary(self.report_state)}")
+            writer.close()
+
+    def report(self) -> None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"{len(self.sessions)} sessions, peak memory {peak / 1024:.0f} MiB")
+        header = f"{'':>12} {'':>13} {'p50':>8} {'p99':>8} {'max':>8}"
+        if self.report_state:
+            header += f"    {'state':>8}"
+        print(header)
+        for session in self.sessions.values():
+            print(session.summary(self.report_state))
+
+    async def report_every(self, seconds: float) -> None:
+        while True:
+            await asyncio.sleep(seconds)
+            self.report()
+
+
+async def serve(address: str, report_seconds: float, report_state: bool) -> None:
+    server = GameServer(FloorPool(constants.FLOOR_POOL_FILE), report_state)
+    host, port, path = parse_address(address)
+    if path is not None:
+        listener = await asyncio.start_unix_server(server.on_connect, path)
+    else:
+        listener = await asyncio.start_server(server.on_connect, host, port)
+
+    print(f"serving games at {address}")
+    reporter = asyncio.create_task(server.report_every(report_seconds))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        reporter.cancel()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    return await reader.readexactly(length)
+
+
+async def play_bot(address: str, turns: int, seed: int) -> List[float]:
+    """Press random keys for a number of turns and return how long each took"""
+    host, port, path = parse_address(address)
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    rng = random.Random(seed)
+    round_trips: List[float] = []
+    tiles: Optional[np.ndarray] = apply_frame(await read_frame(reader), None)
+    try:
+        for _ in range(turns):
+            start = time.perf_counter()
+            writer.write(f"{rng.choice(BOT_KEYS)}\n".encode())
+            tiles = apply_frame(await read_frame(reader), tiles)
+            round_trips.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+    return round_trips
+
+
+async def run_bots(address: str, clients: int, turns: int, seed: int) -> None:
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(play_bot(address, turns, seed + client) for client in range(clients))
+    )
+    seconds = time.perf_counter() - start
+
+    round_trips = [value for result in results for value in result]
+    p50, p99, worst = percentiles(round_trips)
+    print(
+        f"{clients} clients played {len(round_trips)} turns in {seconds:.1f}s"
+        f" ({len(round_trips) / seconds:.0f} turns/s)"
+    )
+    print(
+        f"round trip p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms,"
+        f" max {worst * 1000:.2f} ms"
+    )
+
+
+def main() -> None:
+    # the game still uses some of tcod's deprecated names
+    warnings.simplefilter("ignore", FutureWarning)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="host games")
+    serve_parser.add_argument("address", help="host:port or a unix socket path")
+    serve_parser.add_argument(
+        "--report-seconds",
+        type=float,
+        default=10,
+        help="how often to report on the sessions being played",
+    )
+    serve_parser.add_argument(
+        "--report-state",
+        action="store_true",
+        help="measure each session's state in reports, pausing every session to do so",
+    )
+
+    bots_parser = commands.add_parser("bots", help="play games with scripted clients")
+    bots_parser.add_argument("address", help="host:port or a unix socket path")
+    bots_parser.add_argument("--clients", type=int, default=10)
+    bots_parser.add_argument("--turns", type=int, default=100, help="turns per client")
+    bots_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    try:
+        if args.command == "serve":
+            asyncio.run(serve(args.address, args.report_seconds, args.report_state))
+        else:
+            asyncio.run(run_bots(args.address, args.clients, args.turns, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,21 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence, TYPE_CHECKING
+
 from engine import Engine
-from procgen import generate_dungeon
+from procgen import (
+    connect_unreachable,
+    generate_bsp_dungeon,
+    generate_cave,
+    generate_dungeon,
+)
+
+if TYPE_CHECKING:
+    from floor_pool import FloorPool
+
+
+# the generator for each floor, repeating from the start once the list runs out
+FLOOR_GENERATORS = ("rooms", "bsp", "caves")
 
 
 class GameWorld:
@@ -16,7 +32,9 @@ class GameWorld:
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
-        current_floor: int = 0
+        current_floor: int = 0,
+        floor_generators: Sequence[str] = FLOOR_GENERATORS,
+        floor_pool: Optional[FloorPool] = None,
     ):
         self.engine = engine
 
@@ -30,14 +48,56 @@ class GameWorld:
 
         self.current_floor = current_floor
 
+        self.floor_generators = tuple(floor_generators)
+
+        # floors made ahead of time, used instead of generating floors at the depths it covers
+        self.floor_pool = floor_pool
+
+    def generator_for_floor(self, floor: int) -> str:
+        """Return the name of the generator that builds the given floor"""
+        return self.floor_generators[(floor - 1) % len(self.floor_generators)]
+
     def generate_floor(self) -> None:
         self.current_floor += 1
 
-        self.engine.game_map = generate_dungeon(
-            max_rooms=self.max_rooms,
-            room_min_size=self.room_min_size,
-            room_max_size=self.room_max_size,
-            map_width=self.map_width,
-            map_height=self.map_height,
-            engine=self.engine,
-        )
+        if self.floor_pool is not None and self.floor_pool.floor_count(
+            self.current_floor
+        ):
+            self.engine.game_map = self.floor_pool.instantiate(
+                self.current_floor, self.engine
+            )
+            return
+
+        generator = self.generator_for_floor(self.current_floor)
+        if generator == "caves":
+            game_map = generate_cave(
+                map_width=self.map_width,
+                map_height=self.map_height,
+                engine=self.engine,
+            )
+        elif generator == "bsp":
+            game_map = generate_bsp_dungeon(
+                target_rooms=self.max_rooms,
+                room_min_size=self.room_min_size,
+                room_max_size=self.room_max_size,
+                map_width=self.map_width,
+                map_height=self.map_height,
+                engine=self.engine,
+            )
+        elif generator == "rooms":
+            game_map = generate_dungeon(
+                max_rooms=self.max_rooms,
+                room_min_size=self.room_min_size,
+                room_max_size=self.room_max_size,
+                map_width=self.map_width,
+                map_height=self.map_height,
+                engine=self.engine,
+            )
+        else:
+            raise ValueError(f"Unknown floor generator: {generator!r}")
+
+        # the generators connect everything by design; this catches the odd floor where that fails
+        player = self.engine.player
+        connect_unreachable(game_map, (player.x, player.y))
+
+        self.engine.game_map = game_map
@@ -10,6 +10,8 @@ from actions import Action, BumpAction, PickupAction, WaitAction
 import color
 import constants
 import exceptions
+from journal import Journal
+from turn_scheduler import time_to_act
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -18,24 +20,31 @@ if TYPE_CHECKING:
 
 MOVE_KEYS = {
     # arrow keys
-    tcod.event.K_UP: (0, -1),
-    tcod.event.K_DOWN: (0, 1),
-    tcod.event.K_LEFT: (-1, 0),
-    tcod.event.K_RIGHT: (1, 0),
+    tcod.event.KeySym.UP: (0, -1),
+    tcod.event.KeySym.DOWN: (0, 1),
+    tcod.event.KeySym.LEFT: (-1, 0),
+    tcod.event.KeySym.RIGHT: (1, 0),
     # vi keys
-    tcod.event.K_h: (-1, 0),
-    tcod.event.K_j: (0, 1),
-    tcod.event.K_k: (0, -1),
-    tcod.event.K_l: (1, 0),
-    tcod.event.K_y: (-1, -1),
-    tcod.event.K_u: (1, -1),
-    tcod.event.K_b: (-1, 1),
-    tcod.event.K_n: (1, 1),
+    tcod.event.KeySym.H: (-1, 0),
+    tcod.event.KeySym.J: (0, 1),
+    tcod.event.KeySym.K: (0, -1),
+    tcod.event.KeySym.L: (1, 0),
+    tcod.event.KeySym.Y: (-1, -1),
+    tcod.event.KeySym.U: (1, -1),
+    tcod.event.KeySym.B: (-1, 1),
+    tcod.event.KeySym.N: (1, 1),
 }
 
-WAIT_KEYS = {tcod.event.K_PERIOD}
+WAIT_KEYS = {tcod.event.KeySym.PERIOD}
 
-CONFIRM_KEYS = {tcod.event.K_RETURN, tcod.event.K_KP_ENTER}
+CONFIRM_KEYS = {tcod.event.KeySym.RETURN, tcod.event.KeySym.KP_ENTER}
+
+# events which can change what is on screen; anything else only redraws if a handler says so
+REDRAW_EVENTS = (
+    tcod.event.KeyDown,
+    tcod.event.MouseButtonDown,
+    tcod.event.WindowEvent,
+)
 
 
 ActionOrHandler = Union[Action, "BaseEventHandler"]
@@ -48,6 +57,17 @@ If an event handler is returned it will become the active event handler
 
 
 class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
+    # set when the screen may be out of date; the main loop clears it after rendering
+    needs_redraw = True
+    # how long the main loop waits for input before checking needs_redraw again;
+    # None waits for input however long it takes
+    wait_seconds: Optional[float] = None
+
+    def dispatch(self, event: tcod.event.Event) -> Optional[ActionOrHandler]:
+        if isinstance(event, REDRAW_EVENTS):
+            self.needs_redraw = True
+        return super().dispatch(event)
+
     def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         """Handle an event and return the active event handler for the next event"""
         state = self.dispatch(event)
@@ -118,20 +138,31 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        journal = self.engine.journal
+        if journal is not None:
+            journal.begin_turn(self.engine)
+
         try:
             action.perform()
         except exceptions.Impossible as e:
             self.engine.message_log.add_message(e.args[0], color.IMPOSSIBLE)
             return False  # skip enemy turn on exceptions
 
-        self.engine.handle_enemy_turns()
+        self.engine.handle_enemy_turns(
+            time_to_act(action.cost, self.engine.player.speed)
+        )
 
         self.engine.update_fov()
+        if journal is not None:
+            journal.end_turn()
         return True
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
         if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+            mouse_location = event.tile.x, event.tile.y
+            if mouse_location != self.engine.mouse_location:
+                self.engine.mouse_location = mouse_location
+                self.needs_redraw = True
 
     def on_render(self, console: tcod.console) -> None:
         self.engine.render(console)
@@ -161,6 +192,8 @@ class MainGameEventHandler(EventHandler):
 
         elif key == tcod.event.K_v:
             return HistoryViewer(self.engine)
+        elif key == tcod.event.K_m:
+            return OverviewHandler(self.engine)
         elif key == tcod.event.K_i:
             return InventoryActivateHandler(self.engine)
         elif key == tcod.event.K_d:
@@ -171,6 +204,13 @@ class MainGameEventHandler(EventHandler):
             return LookHandler(self.engine)
         elif key == tcod.event.K_e:
             self.engine.debug_mode = not self.engine.debug_mode
+            # debugging records turns from here on so they can be stepped through
+            if self.engine.debug_mode and self.engine.journal is None:
+                self.engine.journal = Journal()
+        elif key == tcod.event.K_LEFTBRACKET and self.engine.journal is not None:
+            self.engine.journal.rewind()
+        elif key == tcod.event.K_RIGHTBRACKET and self.engine.journal is not None:
+            self.engine.journal.replay()
         elif key == tcod.event.K_ESCAPE:
             raise SystemExit()
 
@@ -178,9 +218,16 @@ class MainGameEventHandler(EventHandler):
 
 
 class GameOverEventHandler(EventHandler):
+    def __init__(self, engine: Engine, save_path: Optional[str] = constants.SAVE_FILE):
+        super().__init__(engine)
+        # the save deleted on quitting, now that the game is over; None leaves files alone
+        self.save_path = save_path
+
     def on_quit(self) -> None:
-        if os.path.exists(constants.SAVE_FILE):
-            os.remove(constants.SAVE_FILE)
+        if self.save_path is not None:
+            if os.path.exists(self.save_path):
+                os.remove(self.save_path)
+            self.engine.message_log.delete_history()
         raise exceptions.QuitWithoutSaving()
 
     def ev_quit(self, event: tcod.event.Quit) -> None:
@@ -264,6 +311,35 @@ class CharacterScreenEventHandler(AskUserEventHandler):
         )
 
 
+class OverviewHandler(AskUserEventHandler):
+    """Show the explored map shrunk down to fit over the viewport"""
+
+    TITLE = "Overview"
+
+    def on_render(self, console: tcod.Console) -> None:
+        super().on_render(console)
+
+        width = self.engine.viewport_width
+        height = self.engine.viewport_height
+        overview = self.engine.game_map.overview(width - 2, height - 2)
+
+        console.draw_frame(
+            x=0,
+            y=0,
+            width=width,
+            height=height,
+            title=f"{self.TITLE} (1:{overview.scale})",
+            clear=True,
+            fg=(255, 255, 255),
+            bg=(0, 0, 0),
+        )
+        overview.render(
+            console,
+            (width - overview.width) // 2,
+            (height - overview.height) // 2,
+        )
+
+
 class LevelUpEventHandler(AskUserEventHandler):
     TITLE = "Level up"
 
@@ -339,7 +415,8 @@ class InventoryEventHandler(AskUserEventHandler):
         The menu selects a screen position so as not to occlude the player sprite
         """
         super().on_render(console)
-        number_of_items_in_inventory = len(self.engine.player.inventory.contents)
+        inventory = self.engine.player.inventory
+        number_of_items_in_inventory = len(inventory)
 
         x = 40 if self.engine.player.x <= 30 else 0
         y = 0
@@ -348,17 +425,16 @@ class InventoryEventHandler(AskUserEventHandler):
 
         item_strings = []
         if number_of_items_in_inventory > 0:
-            for i, item_name in enumerate(self.engine.player.inventory.contents):
-                item_key = chr(ord("a") + i)
+            for slot, item, count in inventory.slots():
+                item_key = chr(ord("a") + slot)
 
-                item_string = f"({item_key}) {item_name}"
-                item_list = self.engine.player.inventory.item_stack(item_name)
+                item_string = f"({item_key}) {item.name}"
 
-                if len(item_list) > 1:
-                    item_string = f"{item_string} x{len(item_list)}"
+                if count > 1:
+                    item_string = f"{item_string} x{count}"
 
                 # assumption: equippable items do not stack
-                if self.engine.player.equipment.item_is_equipped(item_list[0]):
+                if self.engine.player.equipment.item_is_equipped(item):
                     item_string = f"{item_string} (E)"
 
                 item_strings.append(item_string)
@@ -387,13 +463,10 @@ class InventoryEventHandler(AskUserEventHandler):
         index = key - tcod.event.K_a
 
         if 0 <= index <= 26:
-            try:
-                # this is disgusting, but oh well for now
-                selected_item_name = list(player.inventory.contents.keys())[index]
-                # grab the first item in the stack, if there's a stack
-                # if there's not a stack, grab the item
-                selected_item = player.inventory.item_stack(selected_item_name)[0]
-            except IndexError:
+            # grab the first item in the stack, if there's a stack
+            # if there's not a stack, grab the item
+            selected_item = player.inventory.item_in_slot(index)
+            if selected_item is None:
                 self.engine.message_log.add_message(
                     "Invalid inventory entry", color.INVALID
                 )
@@ -542,7 +615,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         return self.callback((x, y))
 
 
-CURSOR_Y_KEYS = {tcod.event.K_UP: -1, tcod.event.K_DOWN: 1}
+CURSOR_Y_KEYS = {tcod.event.KeySym.UP: -1, tcod.event.KeySym.DOWN: 1}
 
 
 class HistoryViewer(EventHandler):
@@ -550,7 +623,7 @@ class HistoryViewer(EventHandler):
 
     def __init__(self, engine: Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
+        self.log_length = len(engine.message_log)
         self.cursor = self.log_length - 1
 
     def on_render(self, console: tcod.Console) -> None:
@@ -565,13 +638,13 @@ class HistoryViewer(EventHandler):
         )
 
         # render the message log with the cursor parameter
-        self.engine.message_log.render_messages(
+        self.engine.message_log.render(
             log_console,
             1,
             1,
             log_console.width - 2,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            stop=self.cursor + 1,
         )
         log_console.blit(console, 3, 3)
 
@@ -0,0 +1,455 @@
+from __future__ import annotations
+
+from collections import deque
+import enum
+import io
+import operator
+import pickle
+import types
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+# how many turns a journal keeps unless told otherwise; older turns are forgotten
+MAX_TURNS = 1000
+
+# types pickled as part of whatever holds them rather than as objects of their own
+_VALUE_TYPES = frozenset(
+    (str, int, float, bool, type(None), bytes, tuple, list, dict, set, deque)
+)
+# types with a __dict__ which are pickled by reference anyway
+_REFERENCE_TYPES = (
+    type,
+    enum.Enum,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.ModuleType,
+)
+# value types which can't change without being replaced, and those which can change in place
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None), bytes))
+_CONTAINER_TYPES = frozenset((list, dict, set, deque))
+
+
+def _is_fixed(value: object) -> bool:
+    """Return True if a value can only change by being replaced, as far as a state goes"""
+    kind = type(value)
+    if kind in _SCALAR_TYPES:
+        return True
+    if kind is tuple:
+        return all(map(_is_fixed, value))  # type: ignore
+    if kind in _CONTAINER_TYPES:
+        return False
+    # game objects and arrays are recorded on their own, and pickled as tokens
+    return isinstance(value, np.ndarray) or hasattr(value, "__dict__")
+
+
+def _contents(container: object) -> tuple:
+    if type(container) is dict:
+        return (*container, *container.values())  # type: ignore
+    return tuple(container)  # type: ignore
+
+
+def _shape(state: dict) -> Optional[tuple]:
+    """
+    Return what tells that a state is unchanged without pickling it again
+
+    That's the attribute names, the values they hold and the contents of any containers;
+    returns None if the values could change in ways that wouldn't show
+    """
+    values = tuple(state.values())
+    containers = []
+    for index, value in enumerate(values):
+        if type(value) in _CONTAINER_TYPES:
+            contents = _contents(value)
+            if not all(map(_is_fixed, contents)):
+                return None
+            containers.append((index, contents))
+        elif not _is_fixed(value):
+            return None
+    return tuple(state), values, containers
+
+
+def _unchanged(shape: tuple, state: dict) -> bool:
+    """Return True if a state still holds the same values as when its shape was taken"""
+    names, values, containers = shape
+    if tuple(state) != names or not all(map(operator.is_, state.values(), values)):
+        return False
+    for index, contents in containers:
+        current = _contents(values[index])
+        if len(current) != len(contents) or not all(
+            map(operator.is_, current, contents)
+        ):
+            return False
+    return True
+
+
+class TurnDelta(NamedTuple):
+    # the pickled states of the objects a turn changed, by token, before and after it;
+    # objects the turn made unreachable are only needed before, new ones only after
+    before: Dict[int, bytes]
+    after: Dict[int, bytes]
+    # the cells a turn changed in each array: (token, flat indices, before, after)
+    cells: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]
+    # every object the turn's states and cells refer to, which the journal must keep
+    tokens: FrozenSet[int]
+
+    @property
+    def nbytes(self) -> int:
+        """How much memory the recorded changes take, roughly"""
+        return (
+            sum(map(len, self.before.values()))
+            + sum(map(len, self.after.values()))
+            + sum(a.nbytes + b.nbytes + c.nbytes for _, a, b, c in self.cells)
+        )
+
+
+class _StatePickler(pickle.Pickler):
+    """Pickles an object's state, referring to every other game object by its token"""
+
+    def __init__(self, file: io.BytesIO, journal: Journal):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.journal = journal
+        # the game objects referred to, which are pickled in turn
+        self.found: List[object] = []
+
+    def persistent_id(self, obj: object) -> Optional[int]:
+        if type(obj) in _VALUE_TYPES:
+            return None
+        if isinstance(obj, np.ndarray) or (
+            hasattr(obj, "__dict__") and not isinstance(obj, _REFERENCE_TYPES)
+        ):
+            token = self.journal.token(obj)
+            self.found.append(obj)
+            return token
+        return None
+
+
+class Journal:
+    """
+    Records what each turn changed so that turns can be rewound and replayed
+
+    At the end of a turn each game object is compared with how it was at the end
+    of the last turn; objects still holding the same values are passed over,
+    and the rest are pickled on their own, with the objects they refer to pickled as tokens
+    Arrays are compared cell by cell, and the arrays named in a class's `journal_areas`
+    only within the area its `take_changed_area` returns
+    A turn keeps only the states of the objects it changed and the cells it changed,
+    so its memory depends on what happened rather than on the size of the map
+
+    Objects are restored in place, so anything holding on to them stays valid
+    Attributes named in a class's `journal_ignores` are neither recorded nor restored
+    Only the last `max_turns` turns are kept, and objects are let go of
+    once neither the game nor any kept turn refers to them
+    """
+
+    def __init__(self, max_turns: int = MAX_TURNS) -> None:
+        self.max_turns = max_turns
+        self.turns: List[TurnDelta] = []
+        # how many of the recorded turns are currently played; the rest can be replayed
+        self.position = 0
+        # the objects the journal holds on to, by token, which keeps their ids from being reused
+        self._objects: Dict[int, object] = {}
+        self._tokens: Dict[int, int] = {}
+        self._next_token = 0
+        # how many kept turns refer to each token
+        self._turn_refs: Dict[int, int] = {}
+        # the game as of the last turn, by token: object states, the tokens each state
+        # refers to, the shapes which tell the states are unchanged, and array copies
+        self._engine: Optional[Engine] = None
+        self._states: Dict[int, bytes] = {}
+        self._state_refs: Dict[int, FrozenSet[int]] = {}
+        self._shapes: Dict[int, tuple] = {}
+        self._arrays: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(turn.nbytes for turn in self.turns)
+
+    def token(self, obj: object) -> int:
+        """Return the token standing for an object in pickled states"""
+        token = self._tokens.get(id(obj))
+        if token is None:
+            token = self._tokens[id(obj)] = self._next_token
+            self._objects[token] = obj
+            self._next_token += 1
+        return token
+
+    def begin_turn(self, engine: Engine) -> None:
+        """Note the state of the game before a turn, unless it was noted as the last turn ended"""
+        if engine is not self._engine:
+            self._engine = engine
+            self._snapshot()
+
+    def end_turn(self) -> None:
+        """Record what changed since `begin_turn`, forgetting any turns that were rewound"""
+        assert self._engine is not None, "end_turn called before begin_turn"
+        states, state_refs, shapes, arrays, areas = self._walk(reuse=True)
+
+        before: Dict[int, bytes] = {}
+        after: Dict[int, bytes] = {}
+        tokens = set()
+        for token, state in states.items():
+            old = self._states.get(token)
+            if old != state:
+                after[token] = state
+                tokens.add(token)
+                tokens.update(state_refs[token])
+                if old is not None:
+                    before[token] = old
+                    tokens.update(self._state_refs[token])
+        # objects no longer reachable may have been changed on their way out
+        for token in self._states.keys() - states.keys():
+            old = self._states[token]
+            if self._pickle_state(self._objects[token], []) != old:
+                before[token] = old
+                tokens.add(token)
+                tokens.update(self._state_refs[token])
+
+        cells = []
+        for token, array in arrays.items():
+            if token not in self._arrays:
+                self._arrays[token] = array.copy()
+                continue
+            if token in areas:
+                area = areas[token]
+                if area is None:
+                    continue
+                x, y = np.nonzero(self._arrays[token][area] != array[area])
+                changed = np.ravel_multi_index(
+                    (x + area[0].start, y + area[1].start), array.shape
+                )
+            else:
+                changed = np.flatnonzero(self._arrays[token] != array)
+            self._changed_cells(token, changed, cells)
+        for token in self._arrays.keys() - arrays.keys():
+            array = self._objects[token]
+            self._changed_cells(
+                token, np.flatnonzero(self._arrays[token] != array), cells
+            )
+            del self._arrays[token]
+        tokens.update(token for token, _, _, _ in cells)
+
+        self._forget_turns(self.position, len(self.turns))
+        self._keep_turn(TurnDelta(before, after, cells, frozenset(tokens)))
+        self._forget_turns(0, len(self.turns) - self.max_turns)
+        self.position = len(self.turns)
+        self._states, self._state_refs, self._shapes = states, state_refs, shapes
+        self._collect()
+
+    def discard_pending(self) -> None:
+        """
+        Put back whatever changed since the last turn ended without being recorded
+
+        Such as the message saying an action was impossible, which takes no turn
+        """
+        if self._engine is None:
+            return
+        states, cells = self._pending()
+        if states or cells:
+            self._apply(states, cells)
+            self._refresh()
+
+    def rewind(self, turns: int = 1) -> int:
+        """Undo up to the given number of turns and return how many were undone"""
+        count = min(turns, self.position)
+        if not count:
+            return 0
+        self._apply(*self._pending())
+        for _ in range(count):
+            self.position -= 1
+            turn = self.turns[self.position]
+            self._apply(turn.before, [(t, i, old) for t, i, old, _ in turn.cells])
+        self._refresh()
+        return count
+
+    def replay(self, turns: int = 1) -> int:
+        """Redo up to the given number of rewound turns and return how many were redone"""
+        count = min(turns, len(self.turns) - self.position)
+        if not count:
+            return 0
+        self._apply(*self._pending())
+        for _ in range(count):
+            turn = self.turns[self.position]
+            self._apply(turn.after, [(t, i, new) for t, i, _, new in turn.cells])
+            self.position += 1
+        self._refresh()
+        return count
+
+    def _pending(
+        self,
+    ) -> Tuple[Dict[int, bytes], List[Tuple[int, np.ndarray, np.ndarray]]]:
+        """Return the states and array cells as of the last turn which have since changed"""
+        states, _, _, _, _ = self._walk(reuse=True)
+        changed = {
+            token: state
+            for token, state in self._states.items()
+            if states.get(token) != state
+        }
+        cells = []
+        for token, copy in self._arrays.items():
+            indices = np.flatnonzero(copy != self._objects[token])
+            if indices.size:
+                cells.append((token, indices, copy.flat[indices]))
+        return changed, cells
+
+    def _changed_cells(
+        self,
+        token: int,
+        changed: np.ndarray,
+        cells: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]],
+    ) -> None:
+        """Add the changed cells of an array to `cells`, and bring its copy up to date"""
+        if not changed.size:
+            return
+        copy = self._arrays[token]
+        array = self._objects[token]
+        cells.append((token, changed, copy.flat[changed], array.flat[changed]))  # type: ignore
+        copy.flat[changed] = array.flat[changed]  # type: ignore
+
+    def _apply(
+        self,
+        states: Dict[int, bytes],
+        cells: List[Tuple[int, np.ndarray, np.ndarray]],
+    ) -> None:
+        """Put objects and array cells back into the given states"""
+        for token, state in states.items():
+            self._restore(token, state)
+        for token, indices, values in cells:
+            self._objects[token].flat[indices] = values  # type: ignore
+
+    def _refresh(self) -> None:
+        """Catch up with objects and array cells having been put back"""
+        # what's reachable has changed, so the next turn is compared with a fresh snapshot
+        self._snapshot()
+        self._collect()
+
+        # cached drawings of the explored map don't know it was put back
+        assert self._engine is not None
+        game_map = self._engine.game_map
+        game_map.explored_changed(0, 0, game_map.width, game_map.height)
+        game_map.take_changed_area()
+
+    def _keep_turn(self, turn: TurnDelta) -> None:
+        self.turns.append(turn)
+        for token in turn.tokens:
+            self._turn_refs[token] = self._turn_refs.get(token, 0) + 1
+
+    def _forget_turns(self, start: int, stop: int) -> None:
+        """Forget the turns in the given range, moving the position back to match"""
+        if start >= stop:
+            return
+        for turn in self.turns[start:stop]:
+            for token in turn.tokens:
+                self._turn_refs[token] -= 1
+                if not self._turn_refs[token]:
+                    del self._turn_refs[token]
+        del self.turns[start:stop]
+        self.position = max(self.position - (min(stop, self.position) - start), start)
+
+    def _collect(self) -> None:
+        """Let go of the objects that neither the game nor any kept turn refers to"""
+        # only sweep once they could make up most of what's held
+        live = len(self._states) + len(self._arrays) + len(self._turn_refs)
+        if len(self._objects) <= 2 * live + 32:
+            return
+        for token in list(self._objects):
+            if (
+                token not in self._states
+                and token not in self._arrays
+                and token not in self._turn_refs
+            ):
+                del self._tokens[id(self._objects.pop(token))]
+
+    def _snapshot(self) -> None:
+        """Pickle every object reachable from the engine, and copy every array"""
+        states, state_refs, shapes, arrays, _ = self._walk(reuse=False)
+        self._states, self._state_refs, self._shapes = states, state_refs, shapes
+        self._arrays = {token: array.copy() for token, array in arrays.items()}
+
+    def _walk(self, reuse: bool) -> Tuple[
+        Dict[int, bytes],
+        Dict[int, FrozenSet[int]],
+        Dict[int, tuple],
+        Dict[int, np.ndarray],
+        Dict[int, Optional[Tuple[slice, slice]]],
+    ]:
+        """
+        Find every object and array reachable from the engine, and pickle the objects
+
+        With `reuse`, objects holding the same values as at the last turn keep their states
+        Returns the states, the tokens each state refers to, the shapes and the arrays,
+        by token, along with the areas the arrays in `journal_areas` changed within
+        """
+        states: Dict[int, bytes] = {}
+        state_refs: Dict[int, FrozenSet[int]] = {}
+        shapes: Dict[int, tuple] = {}
+        arrays: Dict[int, np.ndarray] = {}
+        areas: Dict[int, Optional[Tuple[slice, slice]]] = {}
+        found: List[object] = [self._engine]
+        while found:
+            obj = found.pop()
+            token = self.token(obj)
+            if token in states or token in arrays:
+                continue
+            if isinstance(obj, np.ndarray):
+                arrays[token] = obj
+                continue
+
+            names = getattr(type(obj), "journal_areas", ())
+            if names:
+                area = obj.take_changed_area()  # type: ignore
+                for name in names:
+                    areas[self.token(getattr(obj, name))] = area
+
+            state = self._state(obj)
+            shape = self._shapes.get(token) if reuse else None
+            if shape is not None and _unchanged(shape, state):
+                states[token] = self._states[token]
+                state_refs[token] = self._state_refs[token]
+                shapes[token] = shape
+                found.extend(map(self._objects.__getitem__, state_refs[token]))
+                continue
+
+            referred: List[object] = []
+            states[token] = self._pickle(state, referred)
+            state_refs[token] = frozenset(map(self.token, referred))
+            shape = _shape(state)
+            if shape is not None:
+                shapes[token] = shape
+            found.extend(referred)
+        return states, state_refs, shapes, arrays, areas
+
+    def _state(self, obj: object) -> dict:
+        """Return the attributes of an object which are recorded"""
+        ignores = getattr(type(obj), "journal_ignores", ())
+        if not ignores:
+            return vars(obj)
+        return {name: value for name, value in vars(obj).items() if name not in ignores}
+
+    def _pickle_state(self, obj: object, found: List[object]) -> bytes:
+        return self._pickle(self._state(obj), found)
+
+    def _pickle(self, state: dict, found: List[object]) -> bytes:
+        buffer = io.BytesIO()
+        pickler = _StatePickler(buffer, self)
+        pickler.dump(state)
+        found.extend(pickler.found)
+        return buffer.getvalue()
+
+    def _restore(self, token: int, state: bytes) -> None:
+        unpickler = pickle.Unpickler(io.BytesIO(state))
+        unpickler.persistent_load = self._objects.__getitem__  # type: ignore
+        obj = self._objects[token]
+        attributes = vars(obj)
+        ignores = getattr(type(obj), "journal_ignores", ())
+        kept = {name: attributes[name] for name in ignores if name in attributes}
+        attributes.clear()
+        attributes.update(unpickler.load())
+        attributes.update(kept)
@@ -1,17 +1,30 @@
+from __future__ import annotations
+
+import argparse
+import time
 import traceback
+from typing import Iterator, List, Optional, TYPE_CHECKING
 
 import tcod
 
+import assets
 import color
 import constants
 import exceptions
 import input_handlers
 import setup_game
 
+# spectator pulls in asyncio, which would slow every start to serve the few that spectate
+if TYPE_CHECKING:
+    from spectator import SpectatorServer
+
 
 SCREEN_WIDTH = 80
 SCREEN_HEIGHT = 50
 
+# how long queued events may be handled before the screen is brought up to date
+EVENT_BATCH_SECONDS = 1 / 30
+
 
 def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
     if isinstance(handler, input_handlers.EventHandler):
@@ -19,10 +32,52 @@ def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
         print("Game saved")
 
 
+def coalesce_mouse_motion(events: List[tcod.event.Event]) -> Iterator[tcod.event.Event]:
+    """Drop each mouse motion event that is immediately followed by another one"""
+    for index, event in enumerate(events):
+        if (
+            isinstance(event, tcod.event.MouseMotion)
+            and index + 1 < len(events)
+            and isinstance(events[index + 1], tcod.event.MouseMotion)
+        ):
+            continue
+        yield event
+
+
+def pending_events(timeout: Optional[float] = None) -> Iterator[tcod.event.Event]:
+    """
+    Wait for input, then yield everything queued up before the next frame should be drawn
+
+    Events arriving while earlier ones are handled are picked up too,
+    so held-down keys are all processed before the screen is redrawn
+    Yields nothing if no input arrives within `timeout` seconds
+    """
+    deadline = time.perf_counter() + EVENT_BATCH_SECONDS
+    events = list(tcod.event.wait(timeout))
+    while events:
+        yield from coalesce_mouse_motion(events)
+        if time.perf_counter() > deadline:
+            return
+        events = list(tcod.event.get())
+
+
 def main() -> None:
-    tileset = tcod.tileset.load_tilesheet(
-        "dejavu10x10_gs_tc.png", 32, 8, tcod.tileset.CHARMAP_TCOD
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--spectate",
+        metavar="ADDRESS",
+        help="let spectator.py watch the game at host:port or a unix socket path",
     )
+    args = parser.parse_args()
+
+    spectators: Optional[SpectatorServer] = None
+    if args.spectate:
+        from spectator import SpectatorServer
+
+        spectators = SpectatorServer(args.spectate)
+        spectators.start()
+
+    tileset = assets.load_tileset()
 
     handler: input_handlers.BaseEventHandler = setup_game.MainMenu()
 
@@ -34,14 +89,22 @@ def main() -> None:
         vsync=True,
     ) as context:
         root_console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        rendered_handler = None
         try:
             while True:
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console)
+                # only draw when a handler changed state, or a new handler took over
+                if handler is not rendered_handler or handler.needs_redraw:
+                    # cleared first, so a change noted by another thread mid-render isn't lost
+                    handler.needs_redraw = False
+                    root_console.clear()
+                    handler.on_render(console=root_console)
+                    context.present(root_console)
+                    if spectators is not None:
+                        spectators.publish(root_console)
+                    rendered_handler = handler
 
                 try:
-                    for event in tcod.event.wait():
+                    for event in pending_events(handler.wait_seconds):
                         context.convert_event(event)
                         handler = handler.handle_events(event)
                 except Exception:
@@ -50,12 +113,16 @@ def main() -> None:
                         handler.engine.message_log.add_message(
                             traceback.format_exc(), color.ERROR
                         )
+                        handler.needs_redraw = True
         except exceptions.QuitWithoutSaving:
             raise
         except SystemExit:  # save and quit
             save_game(handler, constants.SAVE_FILE)
         except BaseException:  # save on unexpected exceptions
             save_game(handler, constants.SAVE_FILE)
+        finally:
+            if spectators is not None:
+                spectators.close()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,9 @@
-from typing import Iterable, List, Reversible, Tuple
+from collections import deque
+import functools
+import json
+import os
+import struct
+from typing import BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 import textwrap
 
 import tcod
@@ -6,6 +11,16 @@ import tcod
 import color
 
 
+# how many recent messages are kept in memory; older ones are spilled to the history file
+MESSAGE_BUFFER_SIZE = 256
+
+# how many wrapped messages are remembered between frames
+WRAP_CACHE_SIZE = 4096
+
+# each entry in a history index is the byte offset of a message in the history file
+HISTORY_INDEX_ENTRY = struct.Struct("<Q")
+
+
 class Message:
     def __init__(self, text: str, fg: Tuple[int, int, int]):
         self.plain_text = text
@@ -21,8 +36,90 @@ class Message:
 
 
 class MessageLog:
-    def __init__(self):
-        self.messages: List[Message] = []
+    """
+    Keeps the most recent messages in memory and spills older ones to an append-only file
+
+    The history file holds one JSON record per line and is paired with an index file
+    of fixed-size offsets so any message can be read back without scanning the history
+    Without a `history_path` spilled messages are simply forgotten
+    """
+
+    # open files aren't part of the game, so rewinding turns leaves them be
+    journal_ignores = ("_history_files",)
+
+    def __init__(
+        self,
+        history_path: Optional[str] = None,
+        buffer_size: int = MESSAGE_BUFFER_SIZE,
+    ):
+        self.messages: Deque[Message] = deque()
+        self.buffer_size = buffer_size
+        self.history_path = history_path
+        # the number of messages written to the history file
+        self.spilled = 0
+        self._history_files: Dict[Tuple[str, str], BinaryIO] = {}
+
+        if history_path is not None:
+            # start a fresh history
+            for path in (history_path, self.index_path):
+                with open(path, "wb"):
+                    pass
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.history_path}.idx"
+
+    def __getstate__(self) -> dict:
+        # open files can't be saved; they are reopened on demand
+        state = self.__dict__.copy()
+        state["_history_files"] = {}
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if self.history_path is not None:
+            # the history may have been deleted or truncated since the save was written,
+            # or written to after it, in which case the next spill cuts it back;
+            # loading only reads, as a save may be loaded and never played
+            try:
+                on_disk = os.path.getsize(self.index_path) // HISTORY_INDEX_ENTRY.size
+            except OSError:
+                on_disk = 0
+            self.spilled = min(self.spilled, on_disk)
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.messages)
+
+    def __getitem__(self, index: int) -> Message:
+        """Return the message at `index` in the whole history, reading it from disk if needed"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        if index >= self.spilled:
+            return self.messages[index - self.spilled]
+        return self._read_spilled(index)
+
+    def iter_backwards(self, stop: Optional[int] = None) -> Iterator[Message]:
+        """Lazily yield messages newest first, starting just before `stop`"""
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for index in range(stop - 1, -1, -1):
+            yield self[index]
+
+    def close(self) -> None:
+        for history_file in self._history_files.values():
+            history_file.close()
+        self._history_files.clear()
+
+    def delete_history(self) -> None:
+        """Remove the history files from disk; spilled messages are lost"""
+        self.close()
+        if self.history_path is not None:
+            for path in (self.history_path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.spilled = 0
 
     def add_message(
         self, text: str, fg: Tuple[int, int, int] = color.WHITE, *, stack: bool = True
@@ -38,34 +135,101 @@ class MessageLog:
             self.messages[-1].count += 1
         else:
             self.messages.append(Message(text, fg))
+            if len(self.messages) > self.buffer_size:
+                # only the newest message can still stack, so older ones are final
+                self._spill(self.messages.popleft())
+
+    def _open(self, path: str, mode: str) -> BinaryIO:
+        """Return a cached handle on one of the history files"""
+        key = (path, mode)
+        if key not in self._history_files:
+            self._history_files[key] = open(path, mode)
+        return self._history_files[key]
+
+    def _spill(self, message: Message) -> None:
+        if self.history_path is None:
+            return
+
+        history = self._open(self.history_path, "ab")
+        index = self._open(self.index_path, "ab")
+        # turns rewound by a journal may have spilled messages which are back in the buffer,
+        # and a loaded save may be older than the history on disk
+        end = self.spilled * HISTORY_INDEX_ENTRY.size
+        if index.seek(0, os.SEEK_END) > end:
+            index.truncate(end)
+            reader = self._history_files.pop((self.index_path, "rb"), None)
+            if reader is not None:
+                reader.close()
+        record = json.dumps(
+            {"text": message.plain_text, "fg": message.fg, "count": message.count}
+        )
+        history.seek(0, os.SEEK_END)
+        offset = history.tell()
+        history.write(record.encode("utf-8") + b"\n")
+        history.flush()
+        index.write(HISTORY_INDEX_ENTRY.pack(offset))
+        index.flush()
+        self.spilled += 1
+
+    def _read_spilled(self, index: int) -> Message:
+        assert self.history_path is not None
+        index_file = self._open(self.index_path, "rb")
+        index_file.seek(index * HISTORY_INDEX_ENTRY.size)
+        (offset,) = HISTORY_INDEX_ENTRY.unpack(
+            index_file.read(HISTORY_INDEX_ENTRY.size)
+        )
+
+        history = self._open(self.history_path, "rb")
+        history.seek(offset)
+        record = json.loads(history.readline())
+
+        message = Message(record["text"], tuple(record["fg"]))
+        message.count = record["count"]
+        return message
 
     def render(
-        self, console: tcod.Console, x: int, y: int, width: int, height: int
+        self,
+        console: tcod.console.Console,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        stop: Optional[int] = None,
     ) -> None:
-        """Render this log over the given area"""
-        self.render_messages(console, x, y, width, height, self.messages)
+        """
+        Render this log over the given area
+
+        The newest message shown is the one just before `stop`; by default the latest message
+        Only as many messages as fit are read, so the cost doesn't depend on the history length
+        """
+        self.render_messages(console, x, y, width, height, self.iter_backwards(stop))
 
     @staticmethod
-    def wrap(string: str, width: int) -> Iterable[str]:
+    @functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+    def wrap(string: str, width: int) -> Tuple[str, ...]:
+        """Wrap a message to the given width, caching the result for later frames"""
+        lines: List[str] = []
         # handle newlines in messages
         for line in string.splitlines():
-            yield from textwrap.wrap(line, width, expand_tabs=True)
+            lines.extend(textwrap.wrap(line, width, expand_tabs=True))
+        return tuple(lines)
 
     @classmethod
     def render_messages(
         cls,
-        console: tcod.Console,
+        console: tcod.console.Console,
         x: int,
         y: int,
         width: int,
         height: int,
-        messages: Reversible[Message],
+        messages: Iterable[Message],
     ) -> None:
-        """Render the given messages"""
+        """Render the given messages upwards from the bottom of the area, newest first"""
         y_offset = height - 1
 
-        for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text, width))):
+        for message in messages:
+            # full_text includes the count, so a stacked message is rewrapped when it changes
+            for line in reversed(cls.wrap(message.full_text, width)):
                 console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
                 y_offset -= 1
                 if y_offset < 0:
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np  # type: ignore
+from tcod.console import Console
+
+import tile_types
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+class Overview:
+    """
+    The explored map shrunk down so that each cell stands for a square block of tiles
+
+    Cells keep counts of the explored tiles in their blocks,
+    which are recounted only where exploration has changed,
+    so drawing the overview costs the same however large the map is
+    """
+
+    def __init__(self, game_map: GameMap, scale: int):
+        self.game_map = game_map
+        self.scale = scale
+        self.width = -(-game_map.width // scale)
+        self.height = -(-game_map.height // scale)
+        # explored tiles in each block, and how many of them can be walked on
+        self.explored = np.zeros((self.width, self.height), dtype=np.int32, order="F")
+        self.walkable = np.zeros((self.width, self.height), dtype=np.int32, order="F")
+        self.refresh(0, 0, game_map.width, game_map.height)
+
+    def refresh(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Recount the cells covering the given rectangle of the map"""
+        scale = self.scale
+        cell_x1, cell_y1 = max(x1, 0) // scale, max(y1, 0) // scale
+        cell_x2 = min(-(-x2 // scale), self.width)
+        cell_y2 = min(-(-y2 // scale), self.height)
+        if cell_x1 >= cell_x2 or cell_y1 >= cell_y2:
+            return
+
+        area = (
+            slice(cell_x1 * scale, min(cell_x2 * scale, self.game_map.width)),
+            slice(cell_y1 * scale, min(cell_y2 * scale, self.game_map.height)),
+        )
+        explored = self.game_map.explored[area]
+        walkable = explored & self.game_map.tiles["walkable"][area]
+
+        cells = (slice(cell_x1, cell_x2), slice(cell_y1, cell_y2))
+        self.explored[cells] = self._sum_blocks(explored)
+        self.walkable[cells] = self._sum_blocks(walkable)
+
+    def _sum_blocks(self, tiles: np.ndarray) -> np.ndarray:
+        """Sum each scale x scale block of the given tiles, padding blocks cut off by the map edge"""
+        scale = self.scale
+        width, height = tiles.shape
+        padded = np.zeros(
+            (-(-width // scale) * scale, -(-height // scale) * scale), dtype=np.int32
+        )
+        padded[:width, :height] = tiles
+        return padded.reshape(
+            padded.shape[0] // scale, scale, padded.shape[1] // scale, scale
+        ).sum(axis=(1, 3))
+
+    def render(self, console: Console, x: int, y: int) -> None:
+        """Draw the overview with its top left corner at the given console position"""
+        console.tiles_rgb[x : x + self.width, y : y + self.height] = np.select(
+            condlist=[self.walkable > 0, self.explored > 0],
+            choicelist=[tile_types.FLOOR["dark"], tile_types.WALL["dark"]],
+            default=tile_types.SHROUD,
+        )
+
+        scale = self.scale
+        stairs_x, stairs_y = self.game_map.downstairs_location
+        if self.game_map.explored[stairs_x, stairs_y]:
+            console.print(
+                x + stairs_x // scale,
+                y + stairs_y // scale,
+                ">",
+                fg=tuple(tile_types.STAIRS_DOWN["light"]["fg"]),
+            )
+
+        player = self.game_map.engine.player
+        console.print(
+            x + player.x // scale, y + player.y // scale, player.char, fg=player.color
+        )
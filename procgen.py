@@ -1,10 +1,24 @@
 from __future__ import annotations
 
+import heapq
+from itertools import accumulate, islice
 import random
-from typing import Dict, Iterator, List, Tuple, TYPE_CHECKING
-
+from typing import (
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    TYPE_CHECKING,
+)
+
+import numpy as np  # type: ignore
 import tcod
 
+from connectivity import label_regions, largest_region
 import entity_factories
 from game_map import GameMap
 import tile_types
@@ -53,6 +67,42 @@ ENEMY_CHANCES_BY_FLOOR: Dict[int, List[Tuple[Entity, int]]] = {
 }
 
 
+# chance for each tile of a new cave to start out as wall
+CAVE_WALL_CHANCE = 0.45
+
+# rounds of cellular-automata smoothing applied to a new cave
+CAVE_SMOOTHING_STEPS = 4
+
+# caves get as many spawns as a room would for every this many floor tiles,
+#  which keeps them about as crowded as floors of rooms
+CAVE_TILES_PER_ROOM = 200
+
+
+T = TypeVar("T")
+
+
+class FloorTable(Generic[T]):
+    """A table's value for each floor, so that looking a floor up takes no work"""
+
+    def __init__(self, by_floor: List[T]):
+        # one value for each floor down to the table's last change point,
+        #  which holds for every floor below it
+        self.by_floor = by_floor
+
+    def __getitem__(self, floor: int) -> T:
+        return self.by_floor[min(max(floor, 0), len(self.by_floor) - 1)]
+
+
+class SpawnTables(NamedTuple):
+    """The spawn tables compiled into values by floor, as `roll_spawns` takes them"""
+
+    max_monsters: FloorTable[int]
+    max_items: FloorTable[int]
+    # the entities that can spawn on each floor with their cumulative weights
+    enemy_chances: FloorTable[Tuple[List[Entity], List[int]]]
+    item_chances: FloorTable[Tuple[List[Entity], List[int]]]
+
+
 def get_max_value_for_floor(
     weighted_chance_by_floor: List[Tuple[int, int]], floor: int
 ) -> int:
@@ -66,11 +116,10 @@ def get_max_value_for_floor(
     return current
 
 
-def get_entities_at_random(
-    weighted_chance_by_floor: Dict[int, List[Tuple[Entity, int]]],
-    number_of_entities: int,
-    floor: int,
-) -> List[Entity]:
+def get_chances_for_floor(
+    weighted_chance_by_floor: Dict[int, List[Tuple[Entity, int]]], floor: int
+) -> Tuple[List[Entity], List[int]]:
+    """Return the entities that can spawn on a floor with their cumulative weights"""
     weighted_entity_chances = {}
 
     for k, v in weighted_chance_by_floor.items():
@@ -79,15 +128,95 @@ def get_entities_at_random(
         for entity, weight in v:
             weighted_entity_chances[entity] = weight
 
-    chosen_entities = random.choices(
+    return (
         list(weighted_entity_chances.keys()),
-        weights=list(weighted_entity_chances.values()),
-        k=number_of_entities,
+        list(accumulate(weighted_entity_chances.values())),
+    )
+
+
+def compile_spawn_tables(
+    max_monsters_by_floor: List[Tuple[int, int]],
+    max_items_by_floor: List[Tuple[int, int]],
+    enemy_chances_by_floor: Dict[int, List[Tuple[Entity, int]]],
+    item_chances_by_floor: Dict[int, List[Tuple[Entity, int]]],
+) -> SpawnTables:
+    """Work out each table's value for every floor down to its last change point"""
+    return SpawnTables(
+        FloorTable(
+            [
+                get_max_value_for_floor(max_monsters_by_floor, floor)
+                for floor in range(max(dict(max_monsters_by_floor), default=0) + 1)
+            ]
+        ),
+        FloorTable(
+            [
+                get_max_value_for_floor(max_items_by_floor, floor)
+                for floor in range(max(dict(max_items_by_floor), default=0) + 1)
+            ]
+        ),
+        FloorTable(
+            [
+                get_chances_for_floor(enemy_chances_by_floor, floor)
+                for floor in range(max(enemy_chances_by_floor, default=0) + 1)
+            ]
+        ),
+        FloorTable(
+            [
+                get_chances_for_floor(item_chances_by_floor, floor)
+                for floor in range(max(item_chances_by_floor, default=0) + 1)
+            ]
+        ),
+    )
+
+
+# the tables above, compiled once; changes made to them later need compiling again
+SPAWN_TABLES = compile_spawn_tables(
+    MAX_MONSTERS_BY_FLOOR,
+    MAX_ITEMS_BY_FLOOR,
+    ENEMY_CHANCES_BY_FLOOR,
+    ITEM_CHANCES_BY_FLOOR,
+)
+
+
+def get_entities_at_random(
+    chances: FloorTable[Tuple[List[Entity], List[int]]],
+    number_of_entities: int,
+    floor: int,
+) -> List[Entity]:
+    entities, cumulative_weights = chances[floor]
+
+    chosen_entities = random.choices(
+        entities, cum_weights=cumulative_weights, k=number_of_entities
     )
 
     return chosen_entities
 
 
+def roll_spawns(
+    rooms: int, floor: int, tables: SpawnTables = SPAWN_TABLES
+) -> List[List[Entity]]:
+    """
+    Return the monsters and items to spawn in each of a number of rooms
+
+    Every room is rolled for together,
+    so this takes the same few draws however many rooms there are
+    """
+    number_of_monsters = random.choices(range(tables.max_monsters[floor] + 1), k=rooms)
+    number_of_items = random.choices(range(tables.max_items[floor] + 1), k=rooms)
+
+    monsters = iter(
+        get_entities_at_random(tables.enemy_chances, sum(number_of_monsters), floor)
+    )
+    items = iter(
+        get_entities_at_random(tables.item_chances, sum(number_of_items), floor)
+    )
+
+    return [
+        list(islice(monsters, monster_count)) + list(islice(items, item_count))
+        for monster_count, item_count in zip(number_of_monsters, number_of_items)
+    ]
+
+
 class RectangularRoom:
     def __init__(self, x: int, y: int, width: int, height: int):
         self.x1 = x
@@ -116,28 +245,119 @@ class RectangularRoom:
         )
 
 
-def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int) -> None:
-    number_of_monsters = random.randint(
-        0, get_max_value_for_floor(MAX_MONSTERS_BY_FLOOR, floor_number)
-    )
-    number_of_items = random.randint(
-        0, get_max_value_for_floor(MAX_ITEMS_BY_FLOOR, floor_number)
-    )
+class Partition:
+    """
+    A rectangle of the map in a binary space partition
 
-    monsters: List[Entity] = get_entities_at_random(
-        ENEMY_CHANCES_BY_FLOOR, number_of_monsters, floor_number
-    )
+    It is either split into two smaller partitions or left whole to hold a room
+    """
 
-    items: List[Entity] = get_entities_at_random(
-        ITEM_CHANCES_BY_FLOOR, number_of_items, floor_number
-    )
+    def __init__(self, x: int, y: int, width: int, height: int):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.children: Optional[Tuple[Partition, Partition]] = None
+        self.room: Optional[RectangularRoom] = None
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+    def can_split(self, min_size: int) -> bool:
+        """Return whether both halves of a split could still fit a room of `min_size`"""
+        return max(self.width, self.height) >= 2 * min_size
+
+    def split(self, min_size: int) -> Tuple[Partition, Partition]:
+        """Split this partition across its longer side at a random point"""
+        if self.width >= self.height:
+            cut = random.randint(min_size, self.width - min_size)
+            first = Partition(self.x, self.y, cut, self.height)
+            second = Partition(self.x + cut, self.y, self.width - cut, self.height)
+        else:
+            cut = random.randint(min_size, self.height - min_size)
+            first = Partition(self.x, self.y, self.width, cut)
+            second = Partition(self.x, self.y + cut, self.width, self.height - cut)
+
+        self.children = first, second
+        return self.children
+
+    def leaves(self) -> Iterator[Partition]:
+        """Yield the unsplit partitions inside this one, in order"""
+        if self.children is None:
+            yield self
+        else:
+            for child in self.children:
+                yield from child.leaves()
+
+    def add_room(self, room_min_size: int, room_max_size: int) -> RectangularRoom:
+        """Fit a randomly sized room somewhere inside this partition"""
+        # leave a tile spare so the room's far walls stay inside the partition
+        room_width = random.randint(room_min_size, min(room_max_size, self.width - 1))
+        room_height = random.randint(room_min_size, min(room_max_size, self.height - 1))
+
+        x = random.randint(self.x, self.x + self.width - 1 - room_width)
+        y = random.randint(self.y, self.y + self.height - 1 - room_height)
+
+        self.room = RectangularRoom(x, y, room_width, room_height)
+        return self.room
+
+
+def partition_map(
+    map_width: int, map_height: int, partitions: int, min_size: int
+) -> Partition:
+    """
+    Split the map into up to `partitions` pieces at least `min_size` on each side
+
+    The largest piece is always split next, so the pieces stay of similar sizes
+    and each split succeeds the first time
+    """
+    root = Partition(0, 0, map_width, map_height)
+
+    # (negated area, sequence, partition); the sequence keeps ties in order
+    largest: List[Tuple[int, int, Partition]] = [(-root.area, 0, root)]
+    sequence = 1
+    count = 1
+    while count < partitions and largest:
+        _, _, partition = heapq.heappop(largest)
+        if not partition.can_split(min_size):
+            continue
 
-    for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+        for half in partition.split(min_size):
+            heapq.heappush(largest, (-half.area, sequence, half))
+            sequence += 1
+        count += 1
 
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            entity.spawn(dungeon, x, y)
+    return root
+
+
+def spawn_on_free_tiles(
+    dungeon: GameMap, entities: List[Entity], x: int, y: int, free: np.ndarray
+) -> None:
+    """
+    Spawn each entity on a different tile where `free` is True
+
+    `free` covers an area of the map with its top left corner at (x, y)
+    The tiles are drawn all at once without replacement, so nothing needs retrying
+    and only spawns beyond the number of free tiles are left out
+    """
+    xs, ys = np.nonzero(free)
+    chosen = random.sample(range(len(xs)), min(len(entities), len(xs)))
+
+    for entity, index in zip(entities, chosen):
+        entity.spawn(dungeon, x + int(xs[index]), y + int(ys[index]))
+
+
+def place_entities(
+    room: RectangularRoom, dungeon: GameMap, spawns: List[Entity]
+) -> None:
+    # the tiles in the room that nothing has been placed on yet
+    x, y = room.x1 + 1, room.y1 + 1
+    free = dungeon.tiles["walkable"][room.inner].copy()
+    for entity in dungeon.entities_in_rect(x, y, *free.shape):
+        free[entity.x - x, entity.y - y] = False
+
+    spawn_on_free_tiles(dungeon, spawns, x, y, free)
 
 
 def tunnel_between(
@@ -160,6 +380,27 @@ def tunnel_between(
         yield x, y
 
 
+def carve_tunnel(
+    dungeon: GameMap, start: Tuple[int, int], end: Tuple[int, int]
+) -> None:
+    """Dig an L-shaped tunnel between two points"""
+    x1, y1 = start
+    x2, y2 = end
+    if random.random() < 0.5:
+        # move horizontally, then vertically
+        corner_x, corner_y = x2, y1
+    else:
+        # move vertically, then horizontally
+        corner_x, corner_y = x1, y2
+
+    # each leg is a single row or column
+    corner = corner_x, corner_y
+    for (ax, ay), (bx, by) in ((start, corner), (corner, end)):
+        xs = slice(min(ax, bx), max(ax, bx) + 1)
+        ys = slice(min(ay, by), max(ay, by) + 1)
+        dungeon.tiles[xs, ys] = tile_types.FLOOR
+
+
 def generate_dungeon(
     max_rooms: int,
     room_min_size: int,
@@ -198,11 +439,156 @@ def generate_dungeon(
 
             center_of_last_room = new_room.center
 
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
-
         rooms.append(new_room)
 
+    for room, spawns in zip(
+        rooms, roll_spawns(len(rooms), engine.game_world.current_floor)
+    ):
+        place_entities(room, dungeon, spawns)
+
     dungeon.tiles[center_of_last_room] = tile_types.STAIRS_DOWN
     dungeon.downstairs_location = center_of_last_room
+    dungeon.rooms = rooms
+
+    return dungeon
+
+
+def generate_bsp_dungeon(
+    target_rooms: int,
+    room_min_size: int,
+    room_max_size: int,
+    map_width: int,
+    map_height: int,
+    engine: Engine,
+) -> GameMap:
+    """Generate rooms and corridors by binary space partitioning, one room per partition"""
+    player = engine.player
+    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+
+    # a partition needs a tile spare for the walls of a room of the smallest size
+    root = partition_map(map_width, map_height, target_rooms, room_min_size + 1)
+
+    rooms = [leaf.add_room(room_min_size, room_max_size) for leaf in root.leaves()]
+    for room in rooms:
+        dungeon.tiles[room.inner] = tile_types.FLOOR
+
+    # join the two halves of every split, through the rooms nearest the cut
+    splits = [root]
+    while splits:
+        partition = splits.pop()
+        if partition.children is None:
+            continue
+        first, second = partition.children
+        first_room = list(first.leaves())[-1].room
+        second_room = next(second.leaves()).room
+        assert first_room is not None and second_room is not None
+        carve_tunnel(dungeon, first_room.center, second_room.center)
+        splits.extend(partition.children)
+
+    # the partitions are in order across the map, so the first and last rooms are far apart
+    player.place(*rooms[0].center, dungeon)
+    for room, spawns in zip(
+        rooms, roll_spawns(len(rooms), engine.game_world.current_floor)
+    ):
+        place_entities(room, dungeon, spawns)
+
+    dungeon.tiles[rooms[-1].center] = tile_types.STAIRS_DOWN
+    dungeon.downstairs_location = rooms[-1].center
+    dungeon.rooms = rooms
+
+    return dungeon
+
+
+def connect_unreachable(dungeon: GameMap, start: Tuple[int, int]) -> int:
+    """
+    Dig tunnels to the stairs and any spawns that can't be reached from `start`
+
+    Each tunnel runs from something stranded to the nearest reachable tile
+    Returns how many tunnels were dug, which is almost always none
+    """
+    actor_xs, actor_ys = dungeon.actors.positions()
+    item_xs, item_ys = dungeon.items.positions()
+    stairs_x, stairs_y = dungeon.downstairs_location
+    xs = np.concatenate([[stairs_x], actor_xs, item_xs]).astype(np.intp)
+    ys = np.concatenate([[stairs_y], actor_ys, item_ys]).astype(np.intp)
+
+    tunnels = 0
+    while True:
+        labels, _ = label_regions(dungeon.tiles["walkable"])
+        reachable = labels == labels[start]
+        stranded = np.flatnonzero(~reachable[xs, ys])
+        if not len(stranded):
+            return tunnels
+
+        x, y = int(xs[stranded[0]]), int(ys[stranded[0]])
+        reachable_xs, reachable_ys = np.nonzero(reachable)
+        nearest = np.argmin((reachable_xs - x) ** 2 + (reachable_ys - y) ** 2)
+        carve_tunnel(
+            dungeon, (x, y), (int(reachable_xs[nearest]), int(reachable_ys[nearest]))
+        )
+        tunnels += 1
+
+
+def count_wall_neighbours(wall: np.ndarray) -> np.ndarray:
+    """Return how many of the 8 neighbours of each tile are walls, counting off the map as wall"""
+    width, height = wall.shape
+    padded = np.pad(wall, 1, constant_values=True).astype(np.uint8)
+    # sum each 3x3 block as rows of 3 then columns of 3, then leave out the tile itself
+    rows = padded[:-2] + padded[1:-1] + padded[2:]
+    blocks = rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+    return blocks - wall
+
+
+def cave_floor(map_width: int, map_height: int) -> np.ndarray:
+    """Return a boolean array of the floor of a new cave, as one connected region"""
+    # seed NumPy from `random` so that seeding `random` still reproduces a dungeon
+    rng = np.random.default_rng(random.getrandbits(64))
+
+    while True:
+        wall = rng.random((map_width, map_height)) < CAVE_WALL_CHANCE
+        for _ in range(CAVE_SMOOTHING_STEPS):
+            neighbours = count_wall_neighbours(wall)
+            wall = (neighbours >= 5) | (wall & (neighbours >= 4))
+
+        # keep the map edges solid
+        wall[[0, -1], :] = True
+        wall[:, [0, -1]] = True
+
+        floor = largest_region(~wall)
+        if np.count_nonzero(floor) >= 2:
+            return floor
+
+
+def place_cave_entities(dungeon: GameMap, floor: np.ndarray, floor_number: int) -> None:
+    """Spawn monsters and items across a cave, as if its floor were divided into rooms"""
+    rooms = max(1, int(np.count_nonzero(floor)) // CAVE_TILES_PER_ROOM)
+    spawns = [entity for room in roll_spawns(rooms, floor_number) for entity in room]
+
+    free = floor.copy()
+    for entity in dungeon.entities:
+        free[entity.x, entity.y] = False
+
+    spawn_on_free_tiles(dungeon, spawns, 0, 0, free)
+
+
+def generate_cave(map_width: int, map_height: int, engine: Engine) -> GameMap:
+    """Generate an open cave by smoothing random noise with a cellular automaton"""
+    player = engine.player
+    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+
+    floor = cave_floor(map_width, map_height)
+    dungeon.tiles[floor] = tile_types.FLOOR
+
+    xs, ys = np.nonzero(floor)
+    start = random.randrange(len(xs))
+    player.place(int(xs[start]), int(ys[start]), dungeon)
+
+    # the whole floor is connected, so put the stairs as far from the player as it goes
+    distances = (xs - xs[start]) ** 2 + (ys - ys[start]) ** 2
+    stairs = int(np.argmax(distances))
+    dungeon.tiles[xs[stairs], ys[stairs]] = tile_types.STAIRS_DOWN
+    dungeon.downstairs_location = int(xs[stairs]), int(ys[stairs])
+
+    place_cave_entities(dungeon, floor, engine.game_world.current_floor)
 
     return dungeon
@@ -0,0 +1,233 @@
+"""
+Generate many floors across worker processes and report on what they look like
+
+Each floor is generated after `random.seed(seed)`, so any floor can be recreated
+from its seed; seeds run upwards from --seed
+
+    $ python procgen_farm.py --floors 5000 --floor-number 4
+    $ python procgen_farm.py --find "rooms>=28" --find "stairs_distance>=120"
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import multiprocessing
+import operator
+import os
+import random
+import re
+import statistics
+import time
+import warnings
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+import tcod
+
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+class FloorStats(NamedTuple):
+    seed: int
+    seconds: float
+    rooms: int
+    # the fraction of the map that can be walked on
+    coverage: float
+    # steps from the player's start to the stairs
+    stairs_distance: int
+    monsters: int
+    items: int
+
+
+METRICS = FloorStats._fields[1:]
+
+COMPARISONS: Dict[str, Callable[[float, float], bool]] = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+Constraint = Tuple[str, str, float]
+
+
+def parse_constraint(text: str) -> Constraint:
+    """Parse a constraint such as `rooms>=20` into (metric, comparison, value)"""
+    match = re.fullmatch(r"\s*(\w+)\s*(<=|>=|==|<|>)\s*([-+.\d]+)\s*", text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"expected METRIC<OP>VALUE, not {text!r}")
+    metric, comparison, value = match.groups()
+    if metric not in METRICS:
+        raise argparse.ArgumentTypeError(
+            f"unknown metric {metric!r}; choose from {', '.join(METRICS)}"
+        )
+    return metric, comparison, float(value)
+
+
+def matches(stats: FloorStats, constraints: List[Constraint]) -> bool:
+    return all(
+        COMPARISONS[comparison](getattr(stats, metric), value)
+        for metric, comparison, value in constraints
+    )
+
+
+# each worker process builds a game once and generates every floor it's given into it
+_engine: Optional[Engine] = None
+_floor_number = 1
+
+
+def init_worker(args: argparse.Namespace) -> None:
+    global _engine, _floor_number
+
+    # workers that weren't forked from main() start without its warning filter
+    warnings.simplefilter("ignore", FutureWarning)
+
+    from engine import Engine
+    import entity_factories
+    from floor_pool import FloorPool
+    from game_world import GameWorld
+
+    _engine = Engine(
+        player=copy.deepcopy(entity_factories.PLAYER),
+        viewport_width=setup_game.VIEWPORT_WIDTH,
+        viewport_height=setup_game.VIEWPORT_HEIGHT,
+    )
+    _engine.game_world = GameWorld(
+        engine=_engine,
+        map_width=args.map_width,
+        map_height=args.map_height,
+        max_rooms=args.max_rooms,
+        room_min_size=args.room_min_size,
+        room_max_size=args.room_max_size,
+        floor_generators=(args.generator,),
+        floor_pool=FloorPool(args.pool) if args.pool else None,
+    )
+    _floor_number = args.floor_number
+
+
+def generate_floor(seed: int) -> FloorStats:
+    assert _engine is not None
+    random.seed(seed)
+    _engine.game_world.current_floor = _floor_number - 1
+
+    start = time.perf_counter()
+    _engine.game_world.generate_floor()
+    seconds = time.perf_counter() - start
+
+    game_map = _engine.game_map
+    player = _engine.player
+    walkable = game_map.tiles["walkable"]
+
+    graph = tcod.path.SimpleGraph(cost=walkable.astype(np.int8), cardinal=1, diagonal=1)
+    pathfinder = tcod.path.Pathfinder(graph)
+    pathfinder.add_root((player.x, player.y))
+    pathfinder.resolve()
+    distance = int(pathfinder.distance[game_map.downstairs_location])
+
+    return FloorStats(
+        seed=seed,
+        seconds=seconds,
+        rooms=len(game_map.rooms),
+        coverage=float(walkable.mean()),
+        # unreachable tiles are left at the maximum distance
+        stairs_distance=distance if distance < np.iinfo(np.int32).max else -1,
+        monsters=len(game_map.actors) - 1,
+        items=len(game_map.items),
+    )
+
+
+def report(floors: List[FloorStats]) -> None:
+    print(f"{len(floors)} floors")
+    if not floors:
+        return
+    print(
+        f"{'':>16} {'mean':>9} {'min':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"
+    )
+    for metric in METRICS:
+        values = sorted(getattr(floor, metric) for floor in floors)
+        if metric == "seconds":
+            metric, values = "milliseconds", [value * 1000 for value in values]
+        if len(values) < 2:
+            percentiles = values * 99  # quantiles need at least two values
+        else:
+            percentiles = statistics.quantiles(values, n=100, method="inclusive")
+        row = [
+            statistics.fmean(values),
+            values[0],
+            percentiles[49],
+            percentiles[89],
+            percentiles[98],
+            values[-1],
+        ]
+        print(f"{metric:>16} " + " ".join(f"{value:9.3f}" for value in row))
+
+
+def main() -> None:
+    # the game still uses some of tcod's deprecated names,
+    # which would bury the report under warnings from every worker
+    warnings.simplefilter("ignore", FutureWarning)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--floors", type=int, default=1000, help="floors to generate")
+    parser.add_argument("--seed", type=int, default=0, help="the first seed")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="worker processes"
+    )
+    parser.add_argument(
+        "--generator", choices=("rooms", "bsp", "caves"), default="rooms"
+    )
+    parser.add_argument("--floor-number", type=int, default=1)
+    parser.add_argument(
+        "--pool",
+        metavar="PATH",
+        help="draw floors from a pool built by floor_pool.py instead of generating them",
+    )
+    parser.add_argument("--map-width", type=int, default=setup_game.MAP_WIDTH)
+    parser.add_argument("--map-height", type=int, default=setup_game.MAP_HEIGHT)
+    parser.add_argument("--max-rooms", type=int, default=setup_game.MAX_ROOMS)
+    parser.add_argument("--room-min-size", type=int, default=setup_game.ROOM_MIN_SIZE)
+    parser.add_argument("--room-max-size", type=int, default=setup_game.ROOM_MAX_SIZE)
+    parser.add_argument(
+        "--find",
+        type=parse_constraint,
+        action="append",
+        default=[],
+        metavar="METRIC<OP>VALUE",
+        help="list the seeds of floors meeting every constraint given,"
+        f" out of the metrics {', '.join(METRICS)}",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=10, help="stop after finding this many seeds"
+    )
+    args = parser.parse_args()
+
+    seeds = range(args.seed, args.seed + args.floors)
+    chunksize = max(1, min(64, args.floors // (args.processes * 4)))
+
+    with multiprocessing.Pool(
+        args.processes, initializer=init_worker, initargs=(args,)
+    ) as pool:
+        if not args.find:
+            report(list(pool.imap_unordered(generate_floor, seeds, chunksize)))
+            return
+
+        # floors come back in seed order so the lowest matching seeds are found first
+        found = 0
+        searched = 0
+        for stats in pool.imap(generate_floor, seeds, chunksize):
+            searched += 1
+            if matches(stats, args.find):
+                print(stats)
+                found += 1
+                if found >= args.limit:
+                    break
+        print(f"found {found} in {searched} floors")
+
+
+if __name__ == "__main__":
+    main()
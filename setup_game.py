@@ -1,23 +1,25 @@
 from __future__ import annotations
 
+from concurrent.futures import Future
 import copy
 import lzma
 import pickle
+import threading
 import traceback
-from typing import Optional
+from typing import Optional, Tuple, TYPE_CHECKING
 
 import tcod
 
+import assets
 import color
 import constants
-from engine import Engine
-import entity_factories
-from game_world import GameWorld
 import input_handlers
 
-
-# load the bg and remove the alpha channel
-BACKGROUND_IMAGE = tcod.image.load("menu_background.png")[:, :, :3]
+# the gameplay modules are imported when a game is started or loaded,
+# so the main menu can be shown without waiting for them
+if TYPE_CHECKING:
+    from engine import Engine
+    from floor_pool import FloorPool
 
 # TODO: change these to random ranges used in proc_gen.py
 MAP_WIDTH = 120
@@ -26,17 +28,39 @@ MAP_HEIGHT = 64
 VIEWPORT_WIDTH = 80
 VIEWPORT_HEIGHT = 43
 
+# how often the main menu checks on the save it's loading
+PREFETCH_POLL_SECONDS = 0.05
+
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
 
 
-def new_game() -> Engine:
+def new_game(
+    history_path: Optional[str] = constants.HISTORY_FILE,
+    floor_pool: Optional[FloorPool] = None,
+) -> Engine:
+    """
+    Start a new game, with its message history kept at `history_path`
+
+    Games share `floor_pool` if given; otherwise they draw from the default pool file
+    """
+    from engine import Engine
+    import entity_factories
+    from floor_pool import FloorPool
+    from game_world import GameWorld
+
+    if floor_pool is None:
+        floor_pool = FloorPool(constants.FLOOR_POOL_FILE)
+
     # can't use spawn() b/c the game_map doesn't exist yet
     player = copy.deepcopy(entity_factories.PLAYER)
 
     engine = Engine(
-        player=player, viewport_width=VIEWPORT_WIDTH, viewport_height=VIEWPORT_HEIGHT
+        player=player,
+        viewport_width=VIEWPORT_WIDTH,
+        viewport_height=VIEWPORT_HEIGHT,
+        history_path=history_path,
     )
 
     engine.game_world = GameWorld(
@@ -46,6 +70,7 @@ def new_game() -> Engine:
         room_max_size=ROOM_MAX_SIZE,
         map_width=MAP_WIDTH,
         map_height=MAP_HEIGHT,
+        floor_pool=floor_pool,
     )
 
     engine.game_world.generate_floor()
@@ -66,17 +91,62 @@ def new_game() -> Engine:
 
 
 def load_game(filename: str) -> Engine:
+    from engine import Engine
+
     with open(filename, "rb") as f:
         engine = pickle.loads(lzma.decompress(f.read()))
-    assert isinstance(engine, Engine)
+    if not isinstance(engine, Engine):
+        raise TypeError(f"expected a saved Engine, found {type(engine).__name__}")
     return engine
 
 
+def prefetch_game(filename: str) -> Future:
+    """Start loading a saved game on a background thread and return its Future"""
+    future: Future = Future()
+
+    def load() -> None:
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(load_game(filename))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # a daemon thread won't hold up quitting from the menu mid-load
+    threading.Thread(target=load, name="save-prefetch", daemon=True).start()
+    return future
+
+
 class MainMenu(input_handlers.BaseEventHandler):
+    def __init__(self) -> None:
+        # the save is read, decompressed and unpickled while the menu is up,
+        # so continuing doesn't have to wait for it
+        self.saved_game = prefetch_game(constants.SAVE_FILE)
+        # the continue option changes once the load is over
+        self.saved_game.add_done_callback(self.on_prefetch_done)
+
+    def on_prefetch_done(self, future: Future) -> None:
+        self.needs_redraw = True
+
+    @property
+    def wait_seconds(self) -> Optional[float]:  # type: ignore[override]
+        # the main loop has to wake up to notice the load finishing
+        return None if self.saved_game.done() else PREFETCH_POLL_SECONDS
+
+    def continue_option(self) -> Tuple[str, Tuple[int, int, int]]:
+        """Return the label and color of the continue option without waiting for the save"""
+        if not self.saved_game.done():
+            return "[C] Continue (loading…)", color.MENU_TEXT
+        error = self.saved_game.exception()
+        if isinstance(error, FileNotFoundError):
+            return "[C] No saved game", color.MENU_DISABLED
+        if error is not None:
+            return "[C] Saved game corrupt", color.MENU_DISABLED
+        return "[C] Continue last game", color.MENU_TEXT
+
     def on_render(self, console: tcod.Console) -> None:
         # this doesn't seem to work for some reason…
         # OpenGL on Mac issues, possibly…
-        console.draw_semigraphics(BACKGROUND_IMAGE, 0, 0)
+        console.draw_semigraphics(assets.load_background_image(), 0, 0)
 
         console.print(
             console.width // 2,
@@ -94,14 +164,18 @@ class MainMenu(input_handlers.BaseEventHandler):
         )
 
         menu_width = 24
-        for i, text in enumerate(
-            ["[N] Play a new game", "[C] Continue last game", "[Q] Quit"]
+        for i, (text, fg) in enumerate(
+            [
+                ("[N] Play a new game", color.MENU_TEXT),
+                self.continue_option(),
+                ("[Q] Quit", color.MENU_TEXT),
+            ]
         ):
             console.print(
                 console.width // 2,
                 console.height // 2 - 2 + i,
                 text.ljust(menu_width),
-                fg=color.MENU_TEXT,
+                fg=fg,
                 bg=color.BLACK,
                 alignment=tcod.CENTER,
                 bg_blend=tcod.BKGND_ALPHA(64),
@@ -114,13 +188,12 @@ class MainMenu(input_handlers.BaseEventHandler):
             raise SystemExit()
         elif event.sym == tcod.event.K_c:
             try:
-                return input_handlers.MainGameEventHandler(
-                    load_game(constants.SAVE_FILE)
-                )
+                # usually finished already; otherwise wait for the rest of the load
+                return input_handlers.MainGameEventHandler(self.saved_game.result())
             except FileNotFoundError:
                 return input_handlers.PopupMessage(self, "No saved game to load")
             except Exception as e:
-                traceback.print_exc()
+                traceback.print_exception(type(e), e, e.__traceback__)
                 return input_handlers.PopupMessage(self, f"Failed to load save:\n{e}")
         elif event.sym == tcod.event.K_n:
             return input_handlers.MainGameEventHandler(new_game())
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+from tcod.map import compute_fov
+
+if TYPE_CHECKING:
+    from entity import Actor
+    from game_map import GameMap
+
+
+# how far an actor sees unless its type says otherwise
+DEFAULT_SIGHT_RADIUS = 8
+
+# fields of view are only shared out between threads when there are at least this many,
+# and there's more than one CPU to run them on
+PARALLEL_MINIMUM = 16
+WORKERS = os.cpu_count() or 1
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _thread_pool() -> ThreadPoolExecutor:
+    """Return the thread pool fields of view are computed on, starting it the first time"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="sight")
+    return _pool
+
+
+class FieldOfView:
+    """What can be seen from one point, kept as a window of the map around it"""
+
+    def __init__(self, transparency: np.ndarray, x: int, y: int, radius: int):
+        self.x, self.y = x, y
+        self.radius = radius
+        width, height = transparency.shape
+        self.left, self.top = max(x - radius, 0), max(y - radius, 0)
+        right, bottom = min(x + radius + 1, width), min(y + radius + 1, height)
+        # only the tiles within the radius can be seen, so the rest of the map is skipped
+        self.visible = compute_fov(
+            transparency[self.left : right, self.top : bottom],
+            (x - self.left, y - self.top),
+            radius=radius,
+        )
+
+    def __contains__(self, point: Tuple[int, int]) -> bool:
+        x, y = point[0] - self.left, point[1] - self.top
+        width, height = self.visible.shape
+        return 0 <= x < width and 0 <= y < height and bool(self.visible[x, y])
+
+
+class Sight:
+    """
+    Lets actors see for themselves, each as far as its `sight_radius`
+
+    An actor's field of view is only computed when what it's looking for is in range,
+    and is kept until the actor moves, so actors that stand still or are far away
+    cost nothing; `look` computes any that are missing for many actors at once,
+    on a thread pool when there are enough of them
+    The fields of view assume the map's transparency doesn't change
+    """
+
+    def __init__(self, game_map: GameMap):
+        self.game_map = game_map
+        self._fields: Dict[Actor, FieldOfView] = {}
+
+    def in_range(self, actor: Actor, x: int, y: int) -> bool:
+        radius = actor.sight_radius
+        return (x - actor.x) ** 2 + (y - actor.y) ** 2 <= radius**2
+
+    def can_see(self, actor: Actor, x: int, y: int) -> bool:
+        """Return True if the actor can see the given point"""
+        if not self.in_range(actor, x, y):
+            return False
+        if self._is_stale(actor):
+            self._fields[actor] = FieldOfView(
+                self.game_map.tiles["transparent"], actor.x, actor.y, actor.sight_radius
+            )
+        return (x, y) in self._fields[actor]
+
+    def look(self, actors: Iterable[Actor], x: int, y: int) -> None:
+        """Compute the fields of view the actors need to tell whether they see a point"""
+        missing = [
+            actor
+            for actor in actors
+            if self.in_range(actor, x, y) and self._is_stale(actor)
+        ]
+        if not missing:
+            return
+
+        if WORKERS == 1 or len(missing) < PARALLEL_MINIMUM:
+            self._fields.update(zip(missing, self._compute(missing)))
+        else:
+            # tcod lets go of the GIL while it works out a field of view,
+            # so each thread works through a share of the actors at the same time
+            shares = [missing[i::WORKERS] for i in range(WORKERS)]
+            for share, fields in zip(shares, _thread_pool().map(self._compute, shares)):
+                self._fields.update(zip(share, fields))
+
+        # forget the actors that have died or left once they make up most of the cache
+        if len(self._fields) > 2 * len(self.game_map.actors) + 32:
+            self._fields = {
+                actor: field
+                for actor, field in self._fields.items()
+                if actor in self.game_map.actors
+            }
+
+    def _compute(self, actors: List[Actor]) -> List[FieldOfView]:
+        transparency = self.game_map.tiles["transparent"]
+        return [
+            FieldOfView(transparency, actor.x, actor.y, actor.sight_radius)
+            for actor in actors
+        ]
+
+    def _is_stale(self, actor: Actor) -> bool:
+        """Return True if the actor has no field of view, or has moved since it was made"""
+        field = self._fields.get(actor)
+        return field is None or (field.x, field.y, field.radius) != (
+            actor.x,
+            actor.y,
+            actor.sight_radius,
+        )
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from typing import (
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    TYPE_CHECKING,
+)
+
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    from entity import Entity
+
+E = TypeVar("E", bound="Entity")
+
+
+class SpatialIndex(Generic[E]):
+    """
+    A set of entities that also keeps their positions in arrays
+
+    Position queries test every position at once with NumPy,
+    so only the entities they return cost any Python work
+    Entities keep a slot in the arrays while they're in the index; freed slots are reused
+    Moving an entity doesn't update the index by itself; call `update` afterwards
+    """
+
+    def __init__(self) -> None:
+        self._entities: List[Optional[E]] = []
+        self._slots: Dict[E, int] = {}
+        self._free_slots: List[int] = []
+        self._xs = np.zeros(8, dtype=np.intp)
+        self._ys = np.zeros(8, dtype=np.intp)
+        self._used = np.zeros(8, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, entity: object) -> bool:
+        return entity in self._slots
+
+    def __iter__(self) -> Iterator[E]:
+        return iter(self._slots)
+
+    def add(self, entity: E) -> None:
+        if entity in self._slots:
+            self.update(entity)
+            return
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._entities)
+            self._entities.append(None)
+            if slot >= len(self._xs):
+                # double the arrays
+                self._xs = np.concatenate([self._xs, np.zeros_like(self._xs)])
+                self._ys = np.concatenate([self._ys, np.zeros_like(self._ys)])
+                self._used = np.concatenate([self._used, np.zeros_like(self._used)])
+
+        self._entities[slot] = entity
+        self._slots[entity] = slot
+        self._xs[slot] = entity.x
+        self._ys[slot] = entity.y
+        self._used[slot] = True
+
+    def discard(self, entity: E) -> None:
+        slot = self._slots.pop(entity, None)
+        if slot is None:
+            return
+        self._entities[slot] = None
+        self._used[slot] = False
+        self._free_slots.append(slot)
+
+    def update(self, entity: E) -> None:
+        """Record the current position of an entity already in the index"""
+        slot = self._slots[entity]
+        self._xs[slot] = entity.x
+        self._ys[slot] = entity.y
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        count = len(self._entities)
+        return self._xs[:count], self._ys[:count], self._used[:count]
+
+    def _select(self, mask: np.ndarray) -> List[E]:
+        return [self._entities[slot] for slot in np.flatnonzero(mask)]  # type: ignore
+
+    def positions(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return arrays of the x and y coordinates of every entity in the index"""
+        xs, ys, used = self._arrays()
+        return xs[used], ys[used]
+
+    def at(self, x: int, y: int) -> List[E]:
+        """Return the entities at the given location"""
+        xs, ys, used = self._arrays()
+        return self._select(used & (xs == x) & (ys == y))
+
+    def in_radius(self, x: int, y: int, radius: float) -> List[E]:
+        """Return the entities within `radius` (euclidean) of the given location"""
+        xs, ys, used = self._arrays()
+        return self._select(used & ((xs - x) ** 2 + (ys - y) ** 2 <= radius ** 2))
+
+    def in_rect(self, x: int, y: int, width: int, height: int) -> List[E]:
+        """Return the entities inside the given rectangle"""
+        xs, ys, used = self._arrays()
+        return self._select(
+            used & (x <= xs) & (xs < x + width) & (y <= ys) & (ys < y + height)
+        )
+
+    def nearest(
+        self,
+        x: int,
+        y: int,
+        max_range: Optional[float] = None,
+        visible: Optional[np.ndarray] = None,
+        exclude: Optional[E] = None,
+    ) -> Optional[E]:
+        """
+        Return the entity closest to the given location, or None if there isn't one
+
+        `max_range` limits the (euclidean) distance searched
+        `visible` is a boolean map array; entities on False tiles are ignored
+        `exclude` is an entity to leave out, eg the one doing the searching
+        """
+        xs, ys, used = self._arrays()
+        distances = (xs - x) ** 2 + (ys - y) ** 2
+        candidates = used.copy()
+        if max_range is not None:
+            candidates &= distances <= max_range ** 2
+        if visible is not None:
+            candidates[candidates] = visible[xs[candidates], ys[candidates]]
+        if exclude is not None and exclude in self._slots:
+            candidates[self._slots[exclude]] = False
+
+        if not candidates.any():
+            return None
+        slot = np.flatnonzero(candidates)[np.argmin(distances[candidates])]
+        return self._entities[slot]
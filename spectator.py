@@ -0,0 +1,299 @@
+"""
+Let others watch a game as it's played
+
+A game run with `--spectate ADDRESS` publishes its screen to every viewer connected
+to ADDRESS, which is either host:port or the path of a unix socket
+Running this module opens a window showing the game at that address
+
+    $ python main.py --spectate localhost:7777
+    $ python spectator.py localhost:7777
+"""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import struct
+import sys
+import threading
+from typing import Dict, Optional, Set, Tuple
+import zlib
+
+import numpy as np  # type: ignore
+import tcod
+
+# each message is its compressed length followed by a compressed frame
+MESSAGE_HEADER = struct.Struct("<I")
+# a frame is a header, then the flat indices of the cells it changes for diffs,
+# then the new contents of those cells
+FRAME_HEADER = struct.Struct("<BHHI")
+KEYFRAME, DIFF = 0, 1
+# cells are sent without the padding consoles keep between them
+CELL_DT = np.dtype(tcod.console.rgb_graphic)
+
+# bytes a viewer may have waiting before it's sent only keyframes as it catches up
+MAX_VIEWER_BACKLOG = 256 * 1024
+
+
+def parse_address(address: str) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """Return (host, port, None) for host:port or (None, None, path) for a unix socket"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port), None
+    return None, None, address
+
+
+def encode_frame(
+    kind: int, tiles: np.ndarray, indices: Optional[np.ndarray] = None
+) -> bytes:
+    """Encode a keyframe of `tiles`, or a diff of the cells at the given flat indices"""
+    width, height = tiles.shape
+    cells = tiles.ravel(order="F")
+    if indices is None:
+        parts = [
+            FRAME_HEADER.pack(kind, width, height, cells.size),
+            cells.astype(CELL_DT).tobytes(),
+        ]
+    else:
+        parts = [
+            FRAME_HEADER.pack(kind, width, height, indices.size),
+            indices.astype("<u4").tobytes(),
+            cells[indices].astype(CELL_DT).tobytes(),
+        ]
+    payload = zlib.compress(b"".join(parts), 1)
+    return MESSAGE_HEADER.pack(len(payload)) + payload
+
+
+def apply_frame(payload: bytes, tiles: Optional[np.ndarray]) -> np.ndarray:
+    """Apply a compressed frame to the tiles of the last frame and return the result"""
+    data = zlib.decompress(payload)
+    kind, width, height, count = FRAME_HEADER.unpack_from(data)
+    offset = FRAME_HEADER.size
+
+    if kind == KEYFRAME or tiles is None or tiles.shape != (width, height):
+        cells = np.frombuffer(data, dtype=CELL_DT, count=count, offset=offset)
+        return cells.reshape((width, height), order="F").copy(order="F")
+
+    indices = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+    offset += indices.nbytes
+    cells = np.frombuffer(data, dtype=CELL_DT, count=count, offset=offset)
+    tiles.ravel(order="F")[indices] = cells
+    return tiles
+
+
+class FrameEncoder:
+    """Encodes successive frames of a console as a keyframe followed by diffs"""
+
+    def __init__(self) -> None:
+        # the last frame encoded
+        self.tiles: Optional[np.ndarray] = None
+
+    def encode(
+        self, console: tcod.console.Console, always: bool = False
+    ) -> Optional[bytes]:
+        """
+        Encode what changed on the console since the last frame
+
+        An unchanged frame gives None, or an empty diff if `always` is set
+        """
+        tiles = console.tiles_rgb.copy(order="F")
+        previous, self.tiles = self.tiles, tiles
+        if previous is None or previous.shape != tiles.shape:
+            return encode_frame(KEYFRAME, tiles)
+        changed = np.flatnonzero((tiles != previous).ravel(order="F"))
+        if not changed.size and not always:
+            return None
+        return encode_frame(DIFF, tiles, changed)
+
+
+class SpectatorServer:
+    """
+    Publishes frames to viewers from an asyncio loop on a thread of its own
+
+    `publish` only compares and compresses the frame before handing it to the loop,
+    so the game never waits on the network however many viewers there are
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        # viewers, each with whether it has fallen behind and needs a keyframe
+        self._viewers: Dict[asyncio.StreamWriter, bool] = {}
+        # the tasks serving viewers, which end once their viewers are closed,
+        # and the tasks catching viewers up, which are cancelled
+        self._connections: Set[asyncio.Task] = set()
+        self._catch_ups: Set[asyncio.Task] = set()
+        self._encoder = FrameEncoder()
+        # the last frame the loop has been handed
+        self._latest: Optional[np.ndarray] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_server(), self._loop).result()
+
+    async def _start_server(self) -> None:
+        host, port, path = parse_address(self.address)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._on_connect, path)
+        else:
+            self._server = await asyncio.start_server(self._on_connect, host, port)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._viewers):
+            writer.close()
+        self._viewers.clear()
+        for task in self._catch_ups:
+            task.cancel()
+        await asyncio.gather(
+            *self._connections, *self._catch_ups, return_exceptions=True
+        )
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    @staticmethod
+    def _track(tasks: Set[asyncio.Task], task: asyncio.Task) -> None:
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    @property
+    def viewer_count(self) -> int:
+        return len(self._viewers)
+
+    def publish(self, console: tcod.console.Console) -> None:
+        """Send viewers whatever changed on the console since the last frame"""
+        message = self._encoder.encode(console)
+        if message is not None:
+            self._loop.call_soon_threadsafe(
+                self._broadcast, message, self._encoder.tiles
+            )
+
+    def _broadcast(self, message: bytes, tiles: np.ndarray) -> None:
+        self._latest = tiles
+        for writer, behind in list(self._viewers.items()):
+            if behind:
+                continue  # they'll get a keyframe once they've caught up
+            if writer.transport.get_write_buffer_size() > MAX_VIEWER_BACKLOG:
+                # diffs would only pile up behind a viewer that can't keep up
+                self._viewers[writer] = True
+                task = self._loop.create_task(self._catch_up(writer))
+                self._track(self._catch_ups, task)
+            else:
+                writer.write(message)
+
+    async def _catch_up(self, writer: asyncio.StreamWriter) -> None:
+        """Send a viewer the latest frame whole once it has read what it was sent"""
+        try:
+            await writer.drain()
+        except ConnectionError:
+            return
+        if writer in self._viewers and self._latest is not None:
+            writer.write(encode_frame(KEYFRAME, self._latest))
+            self._viewers[writer] = False
+
+    async def _on_connect(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._track(self._connections, task)
+        if self._latest is not None:
+            writer.write(encode_frame(KEYFRAME, self._latest))
+        self._viewers[writer] = False
+
+        # viewers don't send anything; wait for them to hang up
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._viewers.pop(writer, None)
+            writer.close()
+
+
+def connect(address: str) -> socket.socket:
+    host, port, path = parse_address(address)
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        return sock
+    return socket.create_connection((host, port))
+
+
+def read_message(sock: socket.socket, buffer: bytearray) -> Optional[bytes]:
+    """Return the next complete message in `buffer`, reading more if there's any waiting"""
+    try:
+        data = sock.recv(65536)
+    except BlockingIOError:
+        data = b""
+    else:
+        if not data:
+            raise ConnectionError("the game has closed")
+    buffer += data
+
+    if len(buffer) < MESSAGE_HEADER.size:
+        return None
+    (length,) = MESSAGE_HEADER.unpack_from(buffer)
+    end = MESSAGE_HEADER.size + length
+    if len(buffer) < end:
+        return None
+    payload = bytes(buffer[MESSAGE_HEADER.size : end])
+    del buffer[:end]
+    return payload
+
+
+def main() -> None:
+    import assets
+    import constants
+
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+
+    sock = connect(sys.argv[1])
+    sock.setblocking(False)
+    buffer = bytearray()
+    tiles: Optional[np.ndarray] = None
+    context: Optional[tcod.context.Context] = None
+
+    try:
+        while True:
+            payload = read_message(sock, buffer)
+            while payload is not None:
+                tiles = apply_frame(payload, tiles)
+                payload = read_message(sock, buffer)
+
+            if tiles is not None:
+                width, height = tiles.shape
+                if context is None:
+                    context = tcod.context.new(
+                        columns=width,
+                        rows=height,
+                        tileset=assets.load_tileset(),
+                        title=f"{constants.TITLE} (spectating)",
+                        vsync=True,
+                    )
+                console = tcod.console.Console(width, height, order="F")
+                console.tiles_rgb[...] = tiles
+                context.present(console)
+
+            for event in tcod.event.wait(timeout=1 / 30):
+                if isinstance(event, tcod.event.Quit):
+                    return
+    except ConnectionError as error:
+        print(error)
+    finally:
+        if context is not None:
+            context.close()
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Measure how long the game takes to show its first frame
+
+Each run starts a fresh interpreter which imports the game, loads the assets
+and renders the main menu to an offscreen console
+The window itself isn't opened so this can run without a display
+
+    $ python startup_benchmark.py --runs 10
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import constants
+
+
+# time-to-first-frame we aim to stay under, in seconds
+TARGET_SECONDS = 0.5
+
+CHILD_SCRIPT = """
+import time
+start = time.perf_counter()
+
+import tcod
+
+import assets
+import main
+import setup_game
+
+tileset = assets.load_tileset()
+handler = setup_game.MainMenu()
+console = tcod.console.Console(main.SCREEN_WIDTH, main.SCREEN_HEIGHT, order="F")
+handler.on_render(console)
+
+print(time.perf_counter() - start)
+"""
+
+
+def time_startup() -> Tuple[float, float]:
+    """Return (wall time including interpreter startup, time measured inside the game)"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    wall = time.perf_counter() - start
+    return wall, float(output.strip().splitlines()[-1])
+
+
+def report(label: str, samples: List[Tuple[float, float]]) -> None:
+    walls = sorted(wall for wall, _ in samples)
+    insides = sorted(inside for _, inside in samples)
+    print(
+        f"{label:>5}: first frame median {statistics.median(walls) * 1000:7.1f}ms"
+        f" (worst {walls[-1] * 1000:7.1f}ms),"
+        f" of which in-game {statistics.median(insides) * 1000:7.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="warm runs to time")
+    parser.add_argument(
+        "--target",
+        type=float,
+        default=TARGET_SECONDS,
+        help="fail if the median warm time to first frame exceeds this many seconds",
+    )
+    args = parser.parse_args()
+
+    cache_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), constants.ASSET_CACHE_DIR
+    )
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    report("cold", [time_startup()])
+
+    warm = [time_startup() for _ in range(args.runs)]
+    report("warm", warm)
+
+    median = statistics.median(wall for wall, _ in warm)
+    if median > args.target:
+        print(f"FAIL: above the {args.target * 1000:.0f}ms target")
+        sys.exit(1)
+    print(f"OK: within the {args.target * 1000:.0f}ms target")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from entity import Actor
+
+
+# the speed of an ordinary actor; an actor twice as fast acts twice as often
+NORMAL_SPEED = 100
+
+
+def time_to_act(cost: int, speed: int) -> int:
+    """Return the game time an action of the given cost takes an actor of the given speed"""
+    return max(1, cost * NORMAL_SPEED // speed)
+
+
+class TurnScheduler:
+    """
+    Orders actors by the game time at which they next get to act
+
+    Actors sit in a heap of (time, sequence, actor) entries, so scheduling and popping
+    an actor is O(log n) no matter how many actors are waiting
+    Unscheduling an actor only forgets its sequence number;
+    the stale heap entry is skipped when it reaches the top
+    """
+
+    def __init__(self) -> None:
+        self.time = 0
+        self._queue: List[Tuple[int, int, Actor]] = []
+        # the sequence number of each scheduled actor's live heap entry
+        self._entries: Dict[Actor, int] = {}
+        self._sequence = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, actor: Actor) -> bool:
+        return actor in self._entries
+
+    def __iter__(self) -> Iterator[Actor]:
+        return iter(self._entries)
+
+    def schedule(self, actor: Actor, delay: int = 0) -> None:
+        """Schedule an actor to act `delay` units of time from now, replacing any earlier entry"""
+        self._sequence += 1
+        self._entries[actor] = self._sequence
+        heapq.heappush(self._queue, (self.time + delay, self._sequence, actor))
+
+        # drop stale entries once they make up most of the heap
+        if len(self._queue) > 2 * len(self._entries) + 32:
+            self._queue = [
+                entry
+                for entry in self._queue
+                if self._entries.get(entry[2]) == entry[1]
+            ]
+            heapq.heapify(self._queue)
+
+    def unschedule(self, actor: Actor) -> None:
+        """Stop an actor from acting until it is scheduled again"""
+        self._entries.pop(actor, None)
+
+    def pop_due(self, until: int) -> Optional[Actor]:
+        """
+        Return the next actor due to act before `until` and advance the clock to its turn
+
+        The actor stays scheduled while it acts; the caller reschedules it afterwards
+        Returns None and advances the clock to `until` once nobody else is due
+        """
+        while self._queue:
+            time, sequence, actor = self._queue[0]
+            if self._entries.get(actor) != sequence:
+                heapq.heappop(self._queue)  # stale entry
+                continue
+            if time >= until:
+                break
+            heapq.heappop(self._queue)
+            self.time = max(self.time, time)
+            return actor
+
+        self.time = max(self.time, until)
+        return None
+
+    def pop_due_together(self, until: int) -> List[Actor]:
+        """
+        Return every actor due to act at the next moment before `until`, in the order scheduled
+
+        Like `pop_due` this advances the clock, and returns nobody once nobody is due
+        """
+        first = self.pop_due(until)
+        if first is None:
+            return []
+
+        actors = [first]
+        while self._queue:
+            time, sequence, actor = self._queue[0]
+            if self._entries.get(actor) != sequence:
+                heapq.heappop(self._queue)  # stale entry
+                continue
+            if time > self.time:
+                break
+            heapq.heappop(self._queue)
+            actors.append(actor)
+        return actors